@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Benchmarks of the spawner hot paths.
+
+Run from the repository root::
+
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --compare baseline.json
+
+Every benchmark reports seconds per operation. Baselines depend on the
+machine, save one per runner. With ``--compare`` the exit status is 1 if a
+median regressed, see `pytest_spawner.benchmark.compare`.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import sys
+import time
+import argparse
+import threading
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyuv
+
+from pytest_spawner.benchmark import (
+    summarize, compare, save_results, load_results, DEFAULT_TOLERANCE)
+from pytest_spawner.events import EventEmitter
+from pytest_spawner.future import Future
+from pytest_spawner.latency import LatencyMonitor, DEFAULT_STALL_THRESHOLD
+from pytest_spawner.manager import Manager
+from pytest_spawner.plugin import SpawnerApi
+from pytest_spawner.string_buffer import StringBuffer
+
+timer = getattr(time, 'perf_counter', time.time)
+
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name, uses_manager=False, **params):
+    """Register `func(repeats, **params)` returning a list of samples, or a
+    dict of them reported as ``name[key]``, a started `Manager` is passed as
+    `manager` if `uses_manager` is set.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = (func, uses_manager, params)
+        return func
+    return decorator
+
+
+EVENTS_PER_SAMPLE = 10000
+
+
+@benchmark('emitter')
+def emitter_publish_dispatch(repeats):
+    # set up like the emitter of `Manager`, listeners are timed
+    loop = pyuv.Loop()
+    emitter = EventEmitter(loop, monitor=LatencyMonitor(DEFAULT_STALL_THRESHOLD))
+    received = []
+    emitter.subscribe(('state', 'bench', 'read'), lambda evtype, data: received.append(data))
+
+    publish, dispatch = [], []
+    for _ in range(repeats):
+        started = timer()
+        for index in range(EVENTS_PER_SAMPLE):
+            emitter.publish(('state', 'bench', 'read', 'stdout'), index)
+        published = timer()
+        loop.run()
+        publish.append((published - started) / EVENTS_PER_SAMPLE)
+        dispatch.append((timer() - published) / EVENTS_PER_SAMPLE)
+    emitter.stop()
+    assert len(received) == repeats * EVENTS_PER_SAMPLE
+    return {'publish': publish, 'dispatch': dispatch}
+
+
+BUFFER_DATA_SIZE = 1024 * 1024
+
+
+def _string_buffer(repeats, chunk_size, line_size):
+    data = (b'x' * (line_size - 1) + b'\n') * (BUFFER_DATA_SIZE // line_size)
+    chunks = [data[offset:offset + chunk_size] for offset in range(0, len(data), chunk_size)]
+
+    samples = []
+    for _ in range(repeats):
+        buf = StringBuffer()
+        started = timer()
+        for chunk in chunks:
+            buf.feed(chunk)
+            while buf.read_until(b'\n') is not None:
+                pass
+        samples.append(timer() - started)
+    return samples
+
+
+for _chunk_size in (512, 65536):
+    for _line_size in (64, 4096):
+        benchmark(
+            'string_buffer_read_until[chunk=%d,line=%d]' % (_chunk_size, _line_size),
+            chunk_size=_chunk_size, line_size=_line_size)(_string_buffer)
+
+
+@benchmark('future_cross_thread')
+def future_cross_thread(repeats):
+    samples = []
+    for _ in range(repeats):
+        future = Future()
+        started = []
+
+        def resolve():
+            started.append(timer())
+            future.set_result(None)
+
+        thread = threading.Thread(target=resolve)
+        thread.start()
+        future.result()
+        samples.append(timer() - started[0])
+        thread.join()
+    return samples
+
+
+@benchmark('check_output', uses_manager=True)
+def check_output(repeats, manager):
+    spawner = SpawnerApi(manager)
+    samples = []
+    for _ in range(repeats):
+        started = timer()
+        spawner.check_output('true')
+        samples.append(timer() - started)
+    return samples
+
+
+def _spawn_concurrency(repeats, manager, concurrency):
+    spawner = SpawnerApi(manager)
+    samples = []
+    for repeat in range(repeats):
+        started = timer()
+        watchers = [
+            spawner.create('bench-%d-%d' % (repeat, index), 'true').__enter__()
+            for index in range(concurrency)]
+        for watcher in watchers:
+            watcher.result()
+            watcher.__exit__(None, None, None)
+        samples.append((timer() - started) / concurrency)
+    return samples
+
+
+for _concurrency in (1, 8, 32):
+    benchmark('spawn[concurrency=%d]' % _concurrency, uses_manager=True,
+              concurrency=_concurrency)(_spawn_concurrency)
+
+
+def run(names, repeats, warmup):
+    manager = Manager()
+    manager.start()
+    try:
+        results = collections.OrderedDict()
+        for name in names:
+            func, uses_manager, params = BENCHMARKS[name]
+            if uses_manager:
+                params = dict(params, manager=manager)
+            func(warmup, **params)
+            samples = func(repeats, **params)
+            if not isinstance(samples, dict):
+                samples = {None: samples}
+            for key in sorted(samples, key=str):
+                result_name = name if key is None else '%s[%s]' % (name, key)
+                results[result_name] = summarize(samples[key])
+                print('%-50s median %10.3fus  mad %8.3fus  p90 %10.3fus' % (
+                    result_name, results[result_name]['median'] * 1e6,
+                    results[result_name]['mad'] * 1e6, results[result_name]['p90'] * 1e6))
+        return results
+    finally:
+        manager.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run spawner benchmarks.')
+    parser.add_argument('-k', dest='keyword', default=None,
+                        help='only run benchmarks with KEYWORD in the name')
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--save', metavar='PATH', help='save results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown of medians (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if args.keyword is None or args.keyword in name]
+    results = run(names, args.repeats, args.warmup)
+
+    if args.save:
+        save_results(args.save, results)
+    if args.compare:
+        baseline = load_results(args.compare)
+        regressions = compare(results, baseline, args.tolerance)
+        for name in regressions:
+            print('REGRESSION %s: median %.3fus, baseline %.3fus' % (
+                name, results[name]['median'] * 1e6, baseline[name]['median'] * 1e6))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# coding: utf-8
+"""Socket activation, listening sockets are bound by the spawner and
+inherited by processes following the `LISTEN_FDS` convention of systemd.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import socket
+
+import six
+
+LISTEN_FDS_START = 3
+DEFAULT_BACKLOG = 128
+
+# LISTEN_PID should be the pid of the process itself, the shell exports its
+# own pid and replaces itself with the command keeping the same pid
+ACTIVATION_SHIM = 'export LISTEN_PID=$$; exec "$@"'
+
+
+def bind_listen_socket(address, backlog=DEFAULT_BACKLOG):
+    """Bind a listening socket.
+
+    `address` is either a `(host, port)` tuple, port 0 picks a free port,
+    or a path of an unix socket.
+    """
+    if isinstance(address, six.string_types):
+        family = socket.AF_UNIX
+    elif ':' in address[0]:
+        family = socket.AF_INET6
+    else:
+        family = socket.AF_INET
+
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        if family != socket.AF_UNIX:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(address)
+        sock.listen(backlog)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def close_listen_socket(sock):
+    if sock.family == socket.AF_UNIX:
+        path = sock.getsockname()
+        if path:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    sock.close()
+
+
+def wrap_command(cmd, args):
+    """Return executable and args starting `cmd` with LISTEN_PID set."""
+    shell = '/bin/sh'
+    return shell, [shell, '-c', ACTIVATION_SHIM, 'spawner-activation', cmd] + list(args[1:])
@@ -0,0 +1,92 @@
+# coding: utf-8
+"""Statistics for benchmarks of the spawner and of spawned commands.
+
+`summarize` reduces timing samples to robust statistics, `compare` checks
+them against a baseline saved with `save_results`.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+import math
+
+# samples further from the median than this many scaled MADs are outliers
+OUTLIER_THRESHOLD = 3.5
+
+# a median slower than the baseline by more than this fraction is a regression
+DEFAULT_TOLERANCE = 0.1
+
+# scales the MAD to the standard deviation of normally distributed samples
+_MAD_SCALE = 1.4826
+
+
+def percentile(samples, percent):
+    """Linear interpolation between the closest ranks of sorted samples."""
+    if not samples:
+        raise ValueError('no samples')
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * percent / 100.0
+    low = int(math.floor(rank))
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def median(samples):
+    return percentile(samples, 50)
+
+
+def mad(samples):
+    """Median absolute deviation."""
+    center = median(samples)
+    return median([abs(sample - center) for sample in samples])
+
+
+def reject_outliers(samples, threshold=OUTLIER_THRESHOLD):
+    """Samples within `threshold` scaled MADs of the median."""
+    center = median(samples)
+    spread = mad(samples) * _MAD_SCALE
+    if spread == 0:
+        return list(samples)
+    return [sample for sample in samples if abs(sample - center) / spread <= threshold]
+
+
+def summarize(samples, outliers=True):
+    """Robust statistics of `samples`, outliers are dropped unless `outliers` is False."""
+    kept = reject_outliers(samples) if outliers else list(samples)
+    return {
+        'samples': len(samples),
+        'outliers': len(samples) - len(kept),
+        'min': min(kept),
+        'max': max(kept),
+        'median': median(kept),
+        'p90': percentile(kept, 90),
+        'p99': percentile(kept, 99),
+        'mad': mad(kept),
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Names of results with a median slower than the baseline by more than
+    `tolerance` and more than the noise, i.e. twice the baseline MAD.
+    Entries without a median are ignored.
+    """
+    regressions = []
+    for name in sorted(results):
+        # e.g. the ``skipped`` notes of `SpawnerApi.benchmark`
+        if name not in baseline or 'median' not in results[name]:
+            continue
+        current, base = results[name], baseline[name]
+        allowed = max(base['median'] * tolerance, 2 * base['mad'])
+        if current['median'] > base['median'] + allowed:
+            regressions.append(name)
+    return regressions
+
+
+def save_results(path, results):
+    with open(path, 'w') as f_results:
+        json.dump(results, f_results, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f_results:
+        return json.load(f_results)
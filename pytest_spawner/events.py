@@ -9,10 +9,13 @@ import threading
 import pyuv
 import six
 
+from .util import monotonic
+from .latency import listener_name
+
 
 class EventEmitter(object):
 
-    def __init__(self, loop):
+    def __init__(self, loop, monitor=None):
         self._events = {}
         self._wildcards = set()
         self._lock = threading.RLock()
@@ -30,6 +33,16 @@ class EventEmitter(object):
 
         self._stopped = False
 
+        # times listeners, see `.latency.LatencyMonitor`
+        self._monitor = monitor
+
+        # name and number of subscriptions by listener, named at subscribe
+        # time so that dispatch doesn't format strings
+        self._names = {}
+
+        # number of listener calls
+        self.dispatched = 0
+
     def stop(self):
         """Close the event.
         This function clear the list of listeners and stop all idle callback.
@@ -39,6 +52,7 @@ class EventEmitter(object):
         self._queue.clear()
         self._events = {}
         self._wildcards = set()
+        self._names = {}
 
         # close handlers
         if not self._event_dispatcher.closed:
@@ -50,6 +64,17 @@ class EventEmitter(object):
         if not self._waker.closed:
             self._waker.close()
 
+    @property
+    def subscriptions(self):
+        """Number of subscribed listeners."""
+        with self._lock:
+            return sum(len(listeners) for listeners in self._events.values()) + len(self._wildcards)
+
+    @property
+    def queue_depth(self):
+        """Number of events waiting for dispatch."""
+        return len(self._queue) + len(self._wqueue)
+
     def _enqueue(self, evtype, args, kwargs):
         with self._lock:
 
@@ -91,12 +116,13 @@ class EventEmitter(object):
         with self._lock:
 
             if not evtype: # wildcard
-                self._wildcards.add((once, listener))
-                return
+                listeners = self._wildcards
+            else:
+                listeners = self._events.setdefault(evtype, set())
 
-            if evtype not in self._events:
-                self._events[evtype] = set()
-            self._events[evtype].add((once, listener))
+            if (once, listener) not in listeners:
+                listeners.add((once, listener))
+                self._name(listener)
 
     def unsubscribe(self, evtype, listener, once=False):
         """Unsubscribe from an event."""
@@ -106,12 +132,30 @@ class EventEmitter(object):
 
             if not evtype: # wildcard
                 self._wildcards.remove((once, listener))
+                self._unname(listener)
                 return
 
             self._events[evtype].remove((once, listener))
+            self._unname(listener)
             if not self._events[evtype]:
                 self._events.pop(evtype)
 
+    def _name(self, listener):
+        if self._monitor is None:
+            return
+        entry = self._names.get(listener)
+        if entry is None:
+            self._names[listener] = [listener_name(listener), 1]
+        else:
+            entry[1] += 1
+
+    def _unname(self, listener):
+        entry = self._names.get(listener)
+        if entry is not None:
+            entry[1] -= 1
+            if not entry[1]:
+                self._names.pop(listener)
+
     def _send(self, handle):
         wqueue_len = len(self._wqueue)
         queue_len = len(self._queue)
@@ -134,12 +178,21 @@ class EventEmitter(object):
 
     def _send_listeners(self, evtype, listeners, *args, **kwargs):
         to_remove = []
+        monitor = self._monitor
         for once, listener in list(listeners):
+            self.dispatched += 1
+            if monitor is not None:
+                # a previous listener may have unsubscribed this one
+                entry = self._names.get(listener)
+                name = entry[0] if entry is not None else listener_name(listener)
+                started = monotonic()
             try:
                 listener(evtype, *args, **kwargs)
             except Exception:
                 # we ignore all exception
                 logging.error('Uncaught exception in %r', listener, exc_info=True)
+            if monitor is not None:
+                monitor.record(name, monotonic() - started)
 
             if once:
                 # once event
@@ -151,3 +204,5 @@ class EventEmitter(object):
                     listeners.remove((True, listener))
                 except KeyError:
                     pass
+                else:
+                    self._unname(listener)
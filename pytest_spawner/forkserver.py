@@ -0,0 +1,352 @@
+# coding: utf-8
+"""Start Python commands by forking a warmed up interpreter.
+
+Interpreter startup and imports dominate the run time of short Python tools.
+`ForkServer` starts ``python -m pytest_spawner.forkserver`` once, the server
+imports a configured list of modules and then forks a fresh child for every
+request it receives over an unix socket. A request is a pickled
+``(argv, env, cwd)`` tuple framed like the IPC channel (see `.ipc`) with the
+child stdio descriptors attached as ``SCM_RIGHTS`` ancillary data. The server
+answers with ``('pid', pid)`` right after forking and ``('exit', exit_status,
+term_signal, rusage)`` once the child is reaped, then closes the connection.
+
+Only commands running the same interpreter as the server can be forked, i.e.
+``python -m module``, ``python -c code`` and ``python script.py``, see
+`forkable`. Forked children share the state of the preloaded modules, so
+preload only modules that don't start threads or open connections on import.
+
+The server is Python 3 only, it needs `socket.socket.sendmsg`.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import io
+import os
+import sys
+import time
+import array
+import errno
+import fcntl
+import select
+import shutil
+import signal
+import socket
+import tempfile
+import importlib
+import subprocess
+
+from six.moves import cPickle as pickle
+
+from .ipc import MessageDecoder, encode_message
+from .util import rusage_dict
+from .error import SpawnerError
+
+PICKLE_PROTOCOL = 2
+CONNECT_TIMEOUT = 10.0
+
+# the manager loop waits this long for every socket operation of a fork
+FORK_TIMEOUT = 2.0
+
+# stdio and extra descriptors of a child are dup'ed above this number first,
+# so placing them to their final numbers doesn't overwrite each other
+_FD_RESERVE = 64
+_MAX_FDS = 32
+
+# the server exits if the manager process went away, checked this often
+_PARENT_CHECK_INTERVAL = 1.0
+
+
+def supported():
+    return hasattr(socket.socket, 'sendmsg')
+
+
+def forkable(cmd, args):
+    """Whether ``cmd args`` runs Python code the server is able to fork."""
+    if not args or len(args) < 2:
+        return False
+    executable = os.path.realpath(cmd)
+    if executable != os.path.realpath(sys.executable):
+        return False
+    entry = args[1]
+    if entry in ('-m', '-c'):
+        return len(args) > 2
+    return not entry.startswith('-')
+
+
+def send_fds(sock, data, fds):
+    """Send `data` with descriptors `fds` attached to the first chunk."""
+    sent = sock.sendmsg(
+        [data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def recv_message(sock, decoder):
+    """Receive one framed message and the descriptors sent with it."""
+    fds = array.array('i')
+    while True:
+        for payload in decoder.messages():
+            return pickle.loads(payload), list(fds)
+        data, ancdata, _, _ = sock.recvmsg(
+            65536, socket.CMSG_SPACE(_MAX_FDS * fds.itemsize))
+        for level, kind, cmsg_data in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                usable = len(cmsg_data) - len(cmsg_data) % fds.itemsize
+                fds.frombytes(cmsg_data[:usable])
+        if not data:
+            for fd in fds:
+                os.close(fd)
+            return None, []
+        decoder.feed(data)
+
+
+class ForkServer(object):
+    """Client side, owns the server process."""
+
+    def __init__(self, preload=()):
+        self.preload = list(preload)
+        self._process = None
+        self._tmpdir = None
+        self._path = None
+        self._unresponsive = False
+
+    @property
+    def running(self):
+        return (not self._unresponsive and
+                self._process is not None and self._process.poll() is None)
+
+    def start(self):
+        if not supported():
+            raise SpawnerError('the fork server needs Python 3')
+
+        self._unresponsive = False
+        self._tmpdir = tempfile.mkdtemp(prefix='spawner-forkserver-')
+        self._path = os.path.join(self._tmpdir, 'forkserver.sock')
+
+        # make sure the server imports this very package
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [package_root] + [item for item in [env.get('PYTHONPATH')] if item])
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', 'pytest_spawner.forkserver', self._path] + self.preload,
+            env=env, close_fds=True, stdin=subprocess.DEVNULL)
+
+        # the socket appears once preloading is done
+        deadline = time.time() + CONNECT_TIMEOUT
+        while not os.path.exists(self._path):
+            if self._process.poll() is not None or time.time() > deadline:
+                self.stop()
+                raise SpawnerError('unable to start the fork server')
+            time.sleep(0.01)
+
+    def fork(self, argv, env, cwd, fds, timeout=FORK_TIMEOUT):
+        """Ask the server to fork a child, returns the os pid and a socket
+        that receives the exit message.
+
+        This runs on the manager loop, a server not answering within
+        `timeout` is considered wedged and isn't asked again, `running` is
+        False from then on, so later commands are spawned the usual way.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self._path)
+            send_fds(sock, encode_message(
+                pickle.dumps((argv, env, cwd), PICKLE_PROTOCOL)), fds)
+            message, _ = recv_message(sock, MessageDecoder())
+        except socket.timeout:
+            sock.close()
+            self._unresponsive = True
+            raise SpawnerError('the fork server didn\'t answer within %.1fs' % timeout)
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        if message is None or message[0] != 'pid':
+            sock.close()
+            raise SpawnerError('the fork server failed to fork %r' % (argv, ))
+        return message[1], sock
+
+    def stop(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.terminate()
+            self._process.wait()
+            self._process = None
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def __getstate__(self):
+        # a supervisor starts its own server
+        return {'preload': self.preload}
+
+    def __setstate__(self, state):
+        self.__init__(state['preload'])
+
+
+def _exit_details(status):
+    if os.WIFSIGNALED(status):
+        return 0, os.WTERMSIG(status)
+    return os.WEXITSTATUS(status), 0
+
+
+def _run_child(argv, env, cwd, fds):
+    """Body of a forked child, never returns."""
+    code = 1
+    try:
+        reserved = [fcntl.fcntl(fd, fcntl.F_DUPFD, _FD_RESERVE) for fd in fds]
+        for fd in fds:
+            os.close(fd)
+        for target, fd in enumerate(reserved):
+            os.dup2(fd, target)
+            os.close(fd)
+        # the std streams of the server may be None or buffer data of its own
+        sys.stdin = sys.__stdin__ = io.open(0, 'r', closefd=False)
+        sys.stdout = sys.__stdout__ = io.open(1, 'w', closefd=False)
+        sys.stderr = sys.__stderr__ = io.open(
+            2, 'w', buffering=1, errors='backslashreplace', closefd=False)
+
+        os.environ.clear()
+        os.environ.update(env)
+        os.chdir(cwd)
+
+        import runpy
+        if argv[1] == '-m':
+            sys.argv = [argv[2]] + argv[3:]
+            runpy.run_module(argv[2], run_name='__main__', alter_sys=True)
+        elif argv[1] == '-c':
+            sys.argv = ['-c'] + argv[3:]
+            sys.path.insert(0, '')
+            exec(compile(argv[2], '<string>', 'exec'), {'__name__': '__main__'})
+        else:
+            sys.argv = argv[1:]
+            sys.path.insert(0, os.path.dirname(os.path.abspath(argv[1])))
+            runpy.run_path(argv[1], run_name='__main__')
+        code = 0
+    except SystemExit as exc:
+        if exc.code is None:
+            code = 0
+        elif isinstance(exc.code, int):
+            code = exc.code
+        else:
+            sys.stderr.write('%s\n' % (exc.code, ))
+            code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        os._exit(code)
+
+
+class Server(object):
+    """Server side, forks children of the preloaded interpreter."""
+
+    def __init__(self, listener):
+        self._listener = listener
+        self._children = {}
+        self._parent = os.getppid()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        for fd in (self._wakeup_r, self._wakeup_w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def _handle(self, conn):
+        message, fds = recv_message(conn, MessageDecoder())
+        if message is None:
+            conn.close()
+            return
+        argv, env, cwd = message
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self._listener.close()
+            for other in self._children.values():
+                other.close()
+            conn.close()
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+            _run_child(argv, env, cwd, fds)
+
+        for fd in fds:
+            os.close(fd)
+        self._children[pid] = conn
+        self._send(conn, ('pid', pid))
+
+    def _send(self, conn, message):
+        try:
+            conn.sendall(encode_message(pickle.dumps(message, PICKLE_PROTOCOL)))
+        except (OSError, IOError, socket.error):
+            pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status, usage = os.wait4(-1, os.WNOHANG)
+            except OSError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                return
+            if pid == 0:
+                return
+            conn = self._children.pop(pid, None)
+            if conn is not None:
+                self._send(conn, ('exit', ) + _exit_details(status) + (
+                    dict(rusage_dict(usage), exact=True), ))
+                conn.close()
+
+    def serve(self):
+        signal.set_wakeup_fd(self._wakeup_w)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        while os.getppid() == self._parent:
+            try:
+                readable, _, _ = select.select(
+                    [self._listener, self._wakeup_r], [], [], _PARENT_CHECK_INTERVAL)
+            except (OSError, IOError, select.error) as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            if self._wakeup_r in readable:
+                try:
+                    while os.read(self._wakeup_r, 512):
+                        pass
+                except (OSError, IOError):
+                    pass
+            self._reap()
+            if self._listener in readable:
+                conn, _ = self._listener.accept()
+                try:
+                    self._handle(conn)
+                except (OSError, IOError, socket.error):
+                    conn.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path, preload = argv[0], argv[1:]
+
+    for module in preload:
+        importlib.import_module(module)
+
+    # bind to a temporary name, the client waits for the final one
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path + '.tmp')
+    listener.listen(128)
+    os.rename(path + '.tmp', path)
+
+    Server(listener).serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# coding: utf-8
+"""Message framing for the IPC channel of spawned processes.
+
+Every message is sent as a 4 byte big-endian length followed by the payload.
+The module doesn't depend on pyuv, so the child side can simply use `Channel`::
+
+    from pytest_spawner.ipc import Channel
+
+    channel = Channel()
+    command = channel.recv()
+    channel.send(b'done')
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import errno
+import struct
+
+from .string_buffer import StringBuffer
+
+# environment variable with the descriptor number of the channel in the child
+IPC_FD_ENV = 'SPAWNER_IPC_FD'
+DEFAULT_IPC_FD = 3
+
+_header = struct.Struct('!I')
+
+
+def encode_message(payload):
+    """Frame `payload` to be sent over the channel."""
+    return _header.pack(len(payload)) + payload
+
+
+class MessageDecoder(object):
+    """Split a byte stream into messages."""
+
+    def __init__(self):
+        self._buf = StringBuffer()
+        self._size = None
+
+    def feed(self, data):
+        self._buf.feed(data)
+
+    def messages(self):
+        """Yield every complete message received so far."""
+        while True:
+            if self._size is None:
+                header = self._buf.read(_header.size)
+                if header is None:
+                    return
+                self._size = _header.unpack(header)[0]
+
+            payload = self._buf.read(self._size)
+            if payload is None:
+                return
+            self._size = None
+            yield payload
+
+
+class Channel(object):
+    """Child side of the IPC channel, uses blocking IO."""
+
+    def __init__(self, fd=None):
+        if fd is None:
+            fd = int(os.environ.get(IPC_FD_ENV, DEFAULT_IPC_FD))
+        self._fd = fd
+        self._decoder = MessageDecoder()
+        self._pending = []
+
+    def fileno(self):
+        return self._fd
+
+    def send(self, payload):
+        data = memoryview(encode_message(payload))
+        while data:
+            try:
+                written = os.write(self._fd, data)
+            except (OSError, IOError) as exc:
+                if exc.errno != errno.EINTR:
+                    raise
+                continue
+            data = data[written:]
+
+    def recv(self):
+        """Wait for the next message, returns None if the spawner closed the channel."""
+        while not self._pending:
+            try:
+                data = os.read(self._fd, 65536)
+            except (OSError, IOError) as exc:
+                if exc.errno != errno.EINTR:
+                    raise
+                continue
+            if not data:
+                return None
+            self._decoder.feed(data)
+            self._pending.extend(self._decoder.messages())
+        return self._pending.pop(0)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
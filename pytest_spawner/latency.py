@@ -0,0 +1,121 @@
+# coding: utf-8
+"""Find what blocks the manager loop.
+
+Every listener runs on the loop thread, so one slow callback delays the IO
+and exit handling of all processes. `LatencyMonitor` keeps a `Histogram` of
+the run time of every listener, timed by `.events.EventEmitter`, and of the
+loop lag, how late a periodic timer fires. A warning naming the listener is
+logged when a callback or the loop stalls longer than the threshold.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import array
+import logging
+import threading
+
+import pyuv
+
+from .util import monotonic
+
+DEFAULT_STALL_THRESHOLD = 0.1
+LAG_INTERVAL = 0.05
+
+# bucket `i` counts durations below 2 ** i microseconds
+BUCKETS = 32
+
+LOOP_LAG = 'loop lag'
+
+
+def listener_name(listener):
+    """Readable identity of a listener, e.g. ``plugin.ProcessWatcher._on_read``."""
+    owner = getattr(listener, '__self__', None)
+    func = getattr(listener, '__func__', listener)
+    name = getattr(func, '__name__', None)
+    if name is None:
+        return repr(listener)
+    if owner is not None:
+        cls = type(owner)
+        return '%s.%s.%s' % (cls.__module__, cls.__name__, name)
+    return '%s.%s' % (getattr(func, '__module__', '?'), name)
+
+
+class Histogram(object):
+    """Durations in log2 buckets of microseconds."""
+
+    def __init__(self):
+        self.buckets = array.array(str('L'), [0] * BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        index = min(int(seconds * 1e6).bit_length(), BUCKETS - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the percentile, in seconds."""
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(2 ** index / 1e6, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': list(self.buckets),
+        }
+
+
+class LatencyMonitor(object):
+
+    def __init__(self, threshold=DEFAULT_STALL_THRESHOLD):
+        self.threshold = threshold
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        self._expected = None
+
+    def record(self, name, seconds):
+        # called on the loop thread only, the lock just guards adding names
+        # against `snapshot`, a snapshot may see a histogram mid-update
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms[name] = Histogram()
+        histogram.add(seconds)
+        if self.threshold is not None and seconds > self.threshold:
+            logging.warning('%s blocked the spawner loop for %.3fs', name, seconds)
+
+    def start(self, loop):
+        self._timer = pyuv.Timer(loop)
+        self._timer.ref = False
+        self._expected = monotonic() + LAG_INTERVAL
+        self._timer.start(self._on_tick, LAG_INTERVAL, LAG_INTERVAL)
+
+    def stop(self):
+        if self._timer is not None and not self._timer.closed:
+            self._timer.close()
+
+    def _on_tick(self, handle):
+        now = monotonic()
+        self.record(LOOP_LAG, max(now - self._expected, 0.0))
+        self._expected = now + LAG_INTERVAL
+
+    def snapshot(self):
+        """Histograms as dicts by listener name, the loop lag is `LOOP_LAG`."""
+        with self._lock:
+            return dict((name, histogram.as_dict()) for name, histogram in self._histograms.items())
@@ -11,30 +11,48 @@ import pyuv
 from .state import ProcessTracker, ProcessState
 from .events import EventEmitter
 from .error import StateNotFound, StateConflict
+from .resources import ResourceAllocator, split_placeholders
+from .forkserver import ForkServer
+from .sampler import Sampler
+from .util import monotonic
+from .latency import LatencyMonitor, DEFAULT_STALL_THRESHOLD
+from .metrics import Metrics
 
 DEFAULT_GRACEFUL_TIMEOUT = 10.0
 
+# lifecycle timings are kept for this many most recent processes
+MAX_TIMINGS = 10000
+
 
 class Manager(object):
 
     load_evtype = ('load', )
     unload_evtype = ('unload', )
+    detach_evtype = ('detach', )
+    pause_evtype = ('pause', )
+    resume_evtype = ('resume', )
+    ready_evtype = ('ready', )
     commit_evtype = ('commit', )
     start_evtype = ('start', )
     stop_evtype = ('stop', )
     spawn_evtype = ('spawn', )
     reap_evtype = ('reap', )
     exit_evtype = ('exit', )
+    kill_evtype = ('kill', )
 
-    def __init__(self):
+    def __init__(self, namespace=None, forkserver=None, sample_interval=None,
+                 stall_threshold=DEFAULT_STALL_THRESHOLD):
         self._loop = pyuv.Loop()
+        self.namespace = namespace
 
         self._thread = threading.Thread(target=self._target)
         self._thread.daemon = True
-        self._events = EventEmitter(self._loop)
+        # run time of listeners and loop lag
+        self._latency = LatencyMonitor(stall_threshold)
+        self._events = EventEmitter(self._loop, monitor=self._latency)
 
         # initialize the process tracker
-        self._tracker = ProcessTracker(self._loop)
+        self._tracker = ProcessTracker(self._loop, on_kill=self._on_kill)
 
         # maintain process configurations
         self._states = collections.OrderedDict()
@@ -46,6 +64,33 @@ class Manager(object):
 
         self._max_process_id = 0
 
+        # `.state.StateStatus` by name and `.state.ProcessStatus` by os pid, both
+        # are replaced as a whole under the lock and read without it
+        self._status = {}
+        self._os_pid_index = {}
+
+        # lifecycle timings of processes by pid, see `.timings`
+        self._timings = collections.OrderedDict()
+
+        # counters are updated on the loop thread only, see `stats`
+        self._metrics = Metrics()
+        self._metrics.collect('event_queue_depth', lambda: self._events.queue_depth)
+        self._metrics.collect('events_dispatched_total', lambda: self._events.dispatched)
+        self._metrics.collect('tracker_heap_size', lambda: len(self._tracker))
+        self._metrics.collect('processes_running', lambda: len(self._running))
+        self._metrics.collect('configs_loaded', lambda: len(self._states))
+
+        # ports, temporary directories and sockets leased per process name
+        self._resources = ResourceAllocator()
+
+        # configs with `forkserver=True` fork from an interpreter with these modules imported
+        self._forkserver = ForkServer(forkserver) if forkserver is not None else None
+
+        # CPU, memory and IO use of running processes, see `.sampler`
+        self._sampler = None
+        if sample_interval is not None:
+            self._sampler = Sampler(self._loop, sample_interval, self._running, self._lock)
+
     def _publish(self, evtype, **ev):
         event = {'event': evtype}
         event.update(ev)
@@ -61,6 +106,8 @@ class Manager(object):
         if self._started:
             raise RuntimeError('Manager has been started already')
 
+        if self._forkserver is not None:
+            self._forkserver.start()
         self._thread.start()
 
     def stop(self):
@@ -69,11 +116,19 @@ class Manager(object):
 
         self._waker.send()
         self._thread.join()
+        if self._forkserver is not None:
+            self._forkserver.stop()
 
     @property
     def started(self):
         return self._started
 
+    def qualify(self, name):
+        """Add the manager namespace to a process name."""
+        if self.namespace is None:
+            return name
+        return '%s@%s' % (name, self.namespace)
+
     def subscribe(self, evtype, listener, once=False):
         """Subcribe to an event."""
         self._events.subscribe(evtype, listener, once)
@@ -88,16 +143,27 @@ class Manager(object):
             if config.name in self._states:
                 raise StateConflict()
 
-            state = ProcessState(config)
+            # template copies are checked out for every process, see `_spawn_process`
+            placeholders, _ = split_placeholders(config.placeholders())
+            resources = self._resources.lease(config.name, placeholders) if placeholders else None
+            try:
+                state = ProcessState(config, resources)
+            except Exception:
+                self._resources.release(config.name)
+                raise
             self._states[config.name] = state
+            self._update_status(state)
+            if self._sampler is not None:
+                # samples of a previous config with this name
+                self._sampler.forget(config.name)
 
         # notify about new config
         self._publish_from_thread(
-            self.load_evtype, name=config.name, state=state, start=start)
+            self.load_evtype, name=config.name, state=state, start=start, requested=monotonic())
 
     def _on_load(self, evtype, data):
         if data['start']:
-            self._start_process(data['state'])
+            self._start_process(data['state'], data['requested'])
 
     def unload(self, name):
         """Unload a process config."""
@@ -107,25 +173,146 @@ class Manager(object):
 
             # get the state and remove it from the context
             state = self._states.pop(name)
+            self._remove_status(name)
 
         # notify that we unload the process
         self._publish_from_thread(
             self.unload_evtype, name=name, state=state)
 
-    def exists(self, name):
+    def detach(self, name):
+        """Unload a process config leaving its processes running."""
         with self._lock:
-            return name in self._states
+            if name not in self._states:
+                raise StateNotFound()
+
+            state = self._states.pop(name)
+            self._remove_status(name)
+
+        self._publish_from_thread(
+            self.detach_evtype, name=name, state=state)
+
+    def _on_detach(self, evtype, data):
+        state = data['state']
+        with self._lock:
+            for pid, process in list(self._running.items()):
+                if process.name == state.name:
+                    self._running.pop(pid)
+            for process in state.processes:
+                for lease in process.leases:
+                    if lease is not state.resources:
+                        # template copies stay with the process
+                        lease.release(keep_paths=True)
+                process.leases = ()
+            state.detach()
+        state.close()
+        if state.resources is not None:
+            # the processes keep listening on the ports and using the directories
+            self._resources.detach(data['name'], state.resources)
+
+    def _update_status(self, state):
+        """Replace the snapshot of a state, has to be called with the lock held."""
+        if self._states.get(state.name) is not state:
+            # unloaded already
+            return
+
+        status = state.status()
+        old = self._status.get(state.name)
+        statuses = dict(self._status)
+        statuses[state.name] = status
+        index = dict(self._os_pid_index)
+        for process in old.processes if old is not None else ():
+            index.pop(process.os_pid, None)
+        for process in status.processes:
+            if process.os_pid is not None:
+                index[process.os_pid] = process
+        self._status, self._os_pid_index = statuses, index
+
+    def _remove_status(self, name):
+        old = self._status.get(name)
+        if old is None:
+            return
+        statuses = dict(self._status)
+        del statuses[name]
+        index = dict(self._os_pid_index)
+        for process in old.processes:
+            index.pop(process.os_pid, None)
+        self._status, self._os_pid_index = statuses, index
+
+    def status(self, name=None):
+        """`.state.StateStatus` of a config or a dict of all of them by name.
+
+        Doesn't wait for the manager lock, the snapshot is replaced after
+        every change of a state.
+        """
+        if name is None:
+            return dict(self._status)
+        try:
+            return self._status[name]
+        except KeyError:
+            raise StateNotFound()
+
+    def find_by_os_pid(self, os_pid):
+        """`.state.ProcessStatus` of the running process with the os pid or None."""
+        return self._os_pid_index.get(os_pid)
+
+    def exists(self, name):
+        return name in self._status
 
     def get_os_pids(self, name):
+        return self.status(name).os_pids
+
+    def register_template(self, template):
+        """Register a `.template.TemplateDir` for `{template_<name>}` placeholders."""
+        self._resources.register_template(template)
+
+    def lock_ports(self, name, ports):
+        """Lock the ports of a process detached by a previous session, see
+        `.resources.ResourceAllocator.lock_ports`.
+        """
+        self._resources.lock_ports(name, ports)
+
+    def discard_resources(self, name, paths=()):
+        """Unlock the ports of detached processes and remove their directories
+        and `paths`, see `.resources.ResourceAllocator.discard`.
+        """
+        self._resources.discard(name, paths)
+
+    def get_resources(self, name):
+        """Resources leased for placeholders of the process config, template
+        copies are the ones of the latest process.
+        """
+        with self._lock:
+            state = self._get_state(name)
+            values = self._resources.get(name)
+            for process in state.processes[-1:]:
+                for lease in process.leases:
+                    values.update(lease.values)
+        return values
+
+    def get_samples(self, name):
+        """Samples of processes of the config by their pid, see `.sampler.Series`.
+
+        Samples are kept after the config is unloaded until a config with the
+        same name is loaded, they are empty without `sample_interval`.
+        """
+        if self._sampler is None:
+            return {}
+        return self._sampler.get(name)
+
+    def get_listen_addresses(self, name):
         with self._lock:
             if name not in self._states:
                 raise StateNotFound()
 
-            return self._states[name].os_pids
+            return self._states[name].listen_addresses
 
     def _on_unload(self, evtype, data):
         # stop the process now.
         self._stop_process(data['state'])
+        data['state'].close()
+        # a new config might be loaded already with the same name
+        if data['state'].resources is not None:
+            self._resources.release(data['name'], data['state'].resources)
 
     def commit(self, name, graceful_timeout=None, env=None):
         """The process won't be kept alived at the end."""
@@ -135,12 +322,111 @@ class Manager(object):
         # notify that we are starting the process
         self._publish_from_thread(
             self.commit_evtype, name=state.name, state=state,
-            graceful_timeout=graceful_timeout, env=env)
+            graceful_timeout=graceful_timeout, env=env, requested=monotonic())
+
+    def pause(self, name):
+        """Stop processes of a config with SIGSTOP, they don't use CPU until resumed."""
+        with self._lock:
+            state = self._get_state(name)
+            state.paused = True
+            self._update_status(state)
+
+        self._publish_from_thread(self.pause_evtype, name=state.name, state=state)
+
+    def _on_pause(self, evtype, data):
+        with self._lock:
+            data['state'].pause()
+            self._update_status(data['state'])
+
+    def resume(self, name):
+        """Continue processes stopped by `pause`."""
+        with self._lock:
+            state = self._get_state(name)
+            state.paused = False
+            self._update_status(state)
+
+        self._publish_from_thread(self.resume_evtype, name=state.name, state=state)
+
+    def _on_resume(self, evtype, data):
+        with self._lock:
+            data['state'].resume()
+            self._update_status(data['state'])
+
+    def mark_ready(self, name):
+        """Record that running processes of the config are ready to be used."""
+        with self._lock:
+            state = self._get_state(name)
+
+        self._publish_from_thread(self.ready_evtype, name=state.name, state=state, time=monotonic())
+
+    def _on_ready(self, evtype, data):
+        with self._lock:
+            data['state'].ready = True
+            for process in data['state'].processes:
+                process.timings.setdefault('ready', data['time'])
+            self._update_status(data['state'])
+
+    def stats(self):
+        """Counters and gauges by Prometheus sample name, e.g. ``exits_total{status="0"}``.
+
+        Doesn't take the manager lock, see `.metrics`.
+        """
+        return self._metrics.snapshot()
+
+    def internal_sizes(self):
+        """Sizes of internal maps and numbers of loop handles by type, see `.soak`."""
+        sizes = {
+            'running': len(self._running),
+            'states': len(self._states),
+            'status': len(self._status),
+            'os_pid_index': len(self._os_pid_index),
+            'timings': len(self._timings),
+            'subscriptions': self._events.subscriptions,
+            'event_queue': self._events.queue_depth,
+            'tracker': len(self._tracker),
+            'leases': len(self._resources),
+        }
+        while True:
+            try:
+                handles = list(getattr(self._loop, 'handles', ()))
+                break
+            except RuntimeError:
+                # the loop thread closed a handle meanwhile
+                continue
+        for handle in handles:
+            key = 'handles.%s' % type(handle).__name__
+            sizes[key] = sizes.get(key, 0) + 1
+        return sizes
+
+    def get_latency(self):
+        """Run time histograms of event listeners and the loop lag, see `.latency`."""
+        return self._latency.snapshot()
+
+    def get_timings(self):
+        """Lifecycle timings of the last `MAX_TIMINGS` spawned processes, see `.timings`."""
+        with self._lock:
+            return [dict(record, phases=dict(record['phases'])) for record in self._timings.values()]
+
+    def is_paused(self, name):
+        with self._lock:
+            return self._get_state(name).paused
+
+    def send_message(self, name, data, pid=None):
+        """Send a message over the IPC channel of processes spawned with `ipc=True`.
+
+        The message goes to every running process of the config unless
+        `pid` is given.
+        """
+        with self._lock:
+            state = self._get_state(name)
+
+        self._publish_from_thread(
+            state.config.send_evtype, name=state.name, pid=pid, data=data)
 
     def _on_commit(self, evtype, data):
         self._spawn_process(
             state=data['state'], graceful_timeout=data['graceful_timeout'],
-            env=data['env'], once=True)
+            env=data['env'], once=True, requested=data['requested'])
 
     def _get_process_id(self):
         """Generate a process id."""
@@ -153,12 +439,12 @@ class Manager(object):
             raise StateNotFound()
         return self._states[name]
 
-    def _start_process(self, state):
+    def _start_process(self, state, requested=None):
         with self._lock:
             # notify that we are starting the process
             self._publish(self.start_evtype, name=state.name)
 
-            self._spawn_process(state)
+            self._spawn_process(state, requested=requested)
 
     def _stop_process(self, state):
         with self._lock:
@@ -167,20 +453,57 @@ class Manager(object):
 
             self._reap_processes(state)
 
-    def _spawn_process(self, state, once=False, graceful_timeout=None, env=None):
+    def _spawn_process(self, state, once=False, graceful_timeout=None, env=None, requested=None):
         """Spawn a new process and add it to the state."""
         # get internal process id
         pid = self._get_process_id()
 
+        # fresh template copies for this process
+        lease, error = None, None
+        if state.per_process:
+            try:
+                lease = self._resources.checkout(state.name, state.per_process, state.resources)
+            except Exception as exc:
+                error = exc
+
         # start process
-        process = state.make_process(self._loop, self._events, pid, self._on_process_exit)
-        process.spawn(once, graceful_timeout or DEFAULT_GRACEFUL_TIMEOUT, env)
+        process = state.make_process(
+            self._loop, self._events, pid, self._on_process_exit, forkserver=self._forkserver,
+            lease=lease)
+        process.timings['request'] = requested if requested is not None else monotonic()
+        process.metrics = self._metrics
+
+        # leases are dropped on exit, the copies are freed then
+        process.leases = [held for held in (state.resources, lease) if held is not None]
+        for held in process.leases:
+            held.hold()
+        if lease is not None:
+            lease.release()
+
+        if error is None:
+            process.spawn(once, graceful_timeout or DEFAULT_GRACEFUL_TIMEOUT, env)
+        else:
+            # reported like a failed spawn
+            process.once = once
+            self._on_process_exit(process, exception=error, exit_status=None, term_signal=None)
+        if process.running:
+            process.timings['spawn'] = monotonic()
+            self._metrics.inc('spawns_total')
+        with self._lock:
+            self._timings[pid] = dict(
+                name=process.name, pid=pid, os_pid=process.os_pid, phases=process.timings)
+            if len(self._timings) > MAX_TIMINGS:
+                self._timings.popitem(last=False)
 
         # add the process to the running state
         state.queue(process)
+        if state.paused:
+            process.pause()
 
         # we keep a list of all running process by id here
         self._running[pid] = process
+        with self._lock:
+            self._update_status(state)
 
         # notify subscribers about new process
         ev_details = dict(name=process.name, pid=pid, os_pid=process.os_pid)
@@ -193,14 +516,17 @@ class Manager(object):
             try:
                 process = state.dequeue()
             except IndexError:
+                self._update_status(state)
                 return
 
             # remove the pid from the running processes
             if process.pid in self._running:
                 self._running.pop(process.pid)
 
-            # stop the process
+            # stop the process, a paused one has to continue to handle the signal
+            process.timings['reap'] = monotonic()
             process.kill(signal.SIGTERM)
+            process.resume()
 
             # track this process to make sure it's killed after the graceful time
             self._tracker.check(process, process.graceful_timeout)
@@ -220,12 +546,19 @@ class Manager(object):
 
         # start the process tracker
         self._tracker.start()
+        self._latency.start(self._loop)
+        if self._sampler is not None:
+            self._sampler.start()
 
         # manage processes
         self._events.subscribe(self.load_evtype, self._on_load)
         self._events.subscribe(self.commit_evtype, self._on_commit)
         self._events.subscribe(self.exit_evtype, self._on_exit)
         self._events.subscribe(self.unload_evtype, self._on_unload)
+        self._events.subscribe(self.detach_evtype, self._on_detach)
+        self._events.subscribe(self.pause_evtype, self._on_pause)
+        self._events.subscribe(self.resume_evtype, self._on_resume)
+        self._events.subscribe(self.ready_evtype, self._on_ready)
 
         self._started = True
         self._loop.run()
@@ -239,6 +572,9 @@ class Manager(object):
         def shutdown():
             self._started = False
             self._tracker.stop()
+            self._latency.stop()
+            if self._sampler is not None:
+                self._sampler.stop()
             self._events.stop()
 
         # stop all processes
@@ -247,6 +583,8 @@ class Manager(object):
                 if not state.stopped:
                     state.stopped = True
                     self._reap_processes(state)
+                state.close()
+            self._resources.release_all()
 
             self._tracker.on_done(shutdown)
 
@@ -268,9 +606,28 @@ class Manager(object):
                     return
 
                 if not state.active:
+                    self._metrics.inc('restarts_total')
+                    state.restarts += 1
                     self._spawn_process(state)
 
+    def _on_kill(self, process):
+        # the process didn't stop within its graceful timeout
+        self._metrics.inc('kills_total')
+        self._publish(
+            self.kill_evtype, name=process.name, pid=process.pid, os_pid=process.os_pid)
+
     def _on_process_exit(self, process, **kwargs):
+        process.timings['exit'] = monotonic()
+        for lease in process.leases:
+            lease.drop()
+        process.leases = ()
+        if kwargs.get('exception') is not None:
+            status = 'error'
+        elif kwargs.get('term_signal'):
+            status = 'signal %s' % kwargs['term_signal']
+        else:
+            status = str(kwargs.get('exit_status'))
+        self._metrics.inc('exits_total', labels=(('status', status), ))
         with self._lock:
             # maybe uncheck this process from the tracker
             self._tracker.uncheck(process)
@@ -285,12 +642,15 @@ class Manager(object):
                 pass
             else:
                 state.remove(process)
+                self._update_status(state)
 
             # notify other that the process exited
+            spawned = process.timings.get('spawn')
             ev_details = dict(
                 name=process.name,
                 pid=process.pid,
                 once=process.once,
+                run_time=process.timings['exit'] - spawned if spawned is not None else None,
                 **kwargs)
 
             self._publish(self.exit_evtype, **ev_details)
@@ -0,0 +1,56 @@
+# coding: utf-8
+"""Counters and gauges of a manager.
+
+Counters are only incremented on the manager loop thread, so `Metrics`
+doesn't lock, `snapshot` copies them at once and adds values of collectors,
+callables evaluated when the snapshot is taken (queue depth and the like).
+Names follow the Prometheus conventions, counters end with ``_total``, see
+`format_prometheus`.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+PREFIX = 'spawner_'
+
+
+def sample_name(name, labels=()):
+    """Name of a sample like ``exits_total{status="0"}``."""
+    if not labels:
+        return name
+    return '%s{%s}' % (name, ','.join('%s="%s"' % label for label in labels))
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self._counters = {}
+        self._collectors = {}
+
+    def inc(self, name, value=1, labels=()):
+        """Increment a counter, `labels` is a tuple of ``(label, value)`` pairs."""
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def collect(self, name, func, labels=()):
+        """Report `func()` as the value of `name` in snapshots."""
+        self._collectors[(name, labels)] = func
+
+    def snapshot(self):
+        values = dict(self._counters)
+        for key, func in list(self._collectors.items()):
+            values[key] = func()
+        return dict((sample_name(*key), value) for key, value in values.items())
+
+
+def format_prometheus(stats, prefix=PREFIX):
+    """Render a snapshot in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+    for sample in sorted(stats):
+        name = sample.split('{', 1)[0]
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE %s%s %s' % (
+                prefix, name, 'counter' if name.endswith('_total') else 'gauge'))
+        lines.append('%s%s %s' % (prefix, sample, stats[sample]))
+    return '\n'.join(lines) + '\n'
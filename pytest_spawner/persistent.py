@@ -0,0 +1,157 @@
+# coding: utf-8
+"""Keep services running between pytest sessions.
+
+A kept-alive service is recorded in the pytest cache dir with its pid, a
+fingerprint of its command and connection info. The next session reattaches
+to it if the fingerprint didn't change and the recorded process still runs.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import io
+import re
+import json
+import time
+import errno
+import signal
+import shlex
+import hashlib
+
+import six
+
+from .util import which
+
+STOP_POLL_INTERVAL = 0.05
+
+
+def command_fingerprint(cmd, args=None, env=None, cwd=None):
+    """Hash a command line, its environment and the binary it runs."""
+    if args is None:
+        argv = shlex.split(cmd)
+        executable = argv[0] if argv else cmd
+    else:
+        argv = shlex.split(args) if isinstance(args, six.string_types) else list(args)
+        executable = cmd
+    argv = [arg.decode('utf-8', 'replace') if isinstance(arg, bytes) else six.text_type(arg)
+            for arg in argv]
+
+    binary = None
+    path = which(executable)
+    if path is not None:
+        stat = os.stat(path)
+        binary = [os.path.realpath(path), stat.st_size, stat.st_mtime]
+
+    data = {
+        'cmd': cmd,
+        'args': argv,
+        'env': sorted((env or {}).items()),
+        'cwd': cwd,
+        'binary': binary
+    }
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _proc_stat(pid):
+    try:
+        with io.open('/proc/%d/stat' % pid, 'rb') as f_stream:
+            data = f_stream.read()
+    except (IOError, OSError):
+        return None
+    # the command name may contain spaces, fields start after its ')'
+    return data[data.rindex(b')') + 2:].split()
+
+
+def process_start_time(pid):
+    """Start time of a process from /proc, tells apart reused pids."""
+    fields = _proc_stat(pid)
+    return int(fields[19]) if fields is not None else None
+
+
+def process_alive(pid, start_time=None):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        if exc.errno != errno.EPERM:
+            return False
+
+    fields = _proc_stat(pid)
+    if fields is None:
+        # no /proc, trust kill()
+        return True
+    # zombies are dead already, they are just not reaped by their parent
+    return fields[0] != b'Z' and (start_time is None or int(fields[19]) == start_time)
+
+
+def stop_process(pid, start_time=None, timeout=10.0):
+    """Terminate a recorded process, kill it if it doesn't exit in time."""
+    if not process_alive(pid, start_time):
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.time() + timeout
+        while process_alive(pid, start_time):
+            if time.time() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                break
+            time.sleep(STOP_POLL_INTERVAL)
+    except OSError as exc:
+        if exc.errno != errno.ESRCH:
+            raise
+
+
+class KeepAliveStore(object):
+    """Records of kept-alive services in a directory."""
+
+    def __init__(self, root):
+        self.root = root
+        if not os.path.isdir(root):
+            try:
+                os.makedirs(root)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+    def _path(self, name):
+        return os.path.join(self.root, re.sub(r'[^\w.-]', '_', name) + '.json')
+
+    def log_path(self, name, label):
+        return os.path.join(self.root, '%s.%s.log' % (re.sub(r'[^\w.-]', '_', name), label))
+
+    def get(self, name):
+        try:
+            with io.open(self._path(name), encoding='utf-8') as f_stream:
+                return json.load(f_stream)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, name, record):
+        tmp_path = self._path(name) + '.tmp'
+        with io.open(tmp_path, 'w', encoding='utf-8') as f_stream:
+            f_stream.write(six.text_type(json.dumps(record, ensure_ascii=False)))
+        os.rename(tmp_path, self._path(name))
+
+    def remove(self, name):
+        try:
+            os.unlink(self._path(name))
+        except OSError:
+            pass
+
+
+class PersistentService(object):
+    """A service started by this session or reattached from a previous one.
+
+    `watcher` is None for reattached services, they are not managed by this
+    session and no exit is reported for them.
+    """
+
+    def __init__(self, os_pid, info, resources, listen_addresses, reattached=False, watcher=None):
+        self.os_pid = os_pid
+        self.info = info
+        self.resources = resources
+        self.listen_addresses = listen_addresses
+        self.reattached = reattached
+        self.watcher = watcher
+
+    def __repr__(self):
+        return '<PersistentService: os_pid={0.os_pid!r} reattached={0.reattached!r}>'.format(self)
@@ -3,22 +3,94 @@
 from __future__ import absolute_import, unicode_literals
 
 import os
+import json
+import time
+import tempfile
 import contextlib
 import collections
 import logging
+import threading
 
+import six
 import pytest
 import pyuv
 
 from .future import Future
 from .manager import Manager
-from .process import ProcessConfig
+from .process import ProcessConfig, make_pipe
+from .shared import SharedRegistry, SharedService
+from .supervisor import RemoteManager
+from .template import TemplateDir
+from .resources import kept_resources
+from .persistent import (
+    KeepAliveStore, PersistentService, command_fingerprint, process_alive, process_start_time,
+    stop_process)
 from .string_buffer import StringBuffer
-from .error import ProcessError
+from .timings import durations, summary_lines
+from .trace import TraceRecorder
+from .latency import DEFAULT_STALL_THRESHOLD
+from .metrics import format_prometheus
+from .benchmark import summarize, compare, load_results, DEFAULT_TOLERANCE
+from .soak import soak, DEFAULT_CYCLES
+from .error import SpawnerError, ProcessError, TimeoutError
 
-__all__ = ['pytest_configure', 'spawner']
+__all__ = ['pytest_addoption', 'pytest_configure', 'spawner', 'spawner_services', 'service_fixture']
 
 DEFAULT_TIMEOUT = 15.0
+DEFAULT_SHARED_TIMEOUT = 300.0
+DEFAULT_BENCHMARK_WARMUP = 3
+DEFAULT_BENCHMARK_REPEATS = 30
+HEALTH_CHECK_INTERVAL = 0.1
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('spawner')
+    group.addoption(
+        '--spawner-xdist', action='store', dest='spawner_xdist', default='isolate',
+        choices=['isolate', 'share'],
+        help='how xdist workers run shared services: "isolate" starts them in every worker, '
+             '"share" starts them once and shares them between workers (default: isolate).')
+    group.addoption(
+        '--spawner-supervisor', action='store_true', dest='spawner_supervisor', default=False,
+        help='run spawned processes from a separate supervisor process, so handling of their '
+             'output doesn\'t compete with tests for the interpreter.')
+    group.addoption(
+        '--spawner-auto-pause', action='store_true', dest='spawner_auto_pause', default=False,
+        help='pause service fixtures with SIGSTOP while running tests that don\'t use them.')
+    group.addoption(
+        '--spawner-keep-alive', action='store_true', dest='spawner_keep_alive', default=False,
+        help='keep persistent services running after the session and reattach to them '
+             'in the next one while their command doesn\'t change.')
+    group.addoption(
+        '--spawner-forkserver', action='store', dest='spawner_forkserver', default=None,
+        nargs='?', const='', metavar='MODULES',
+        help='fork processes created with forkserver=True that run Python code from '
+             'an interpreter that has imported the comma separated MODULES already.')
+    group.addoption(
+        '--spawner-sample-interval', action='store', dest='spawner_sample_interval',
+        type=float, default=None, metavar='SECONDS',
+        help='sample CPU, memory and IO use of running processes from /proc every SECONDS.')
+    group.addoption(
+        '--spawner-durations', action='store', dest='spawner_durations', type=int,
+        default=None, metavar='N',
+        help='show lifecycle phase durations of the N slowest spawned processes.')
+    group.addoption(
+        '--spawner-durations-json', action='store', dest='spawner_durations_json',
+        default=None, metavar='PATH',
+        help='write lifecycle phase timestamps and durations of spawned processes to PATH.')
+    group.addoption(
+        '--spawner-trace', action='store', dest='spawner_trace', default=None, metavar='PATH',
+        help='write a Chrome trace of spawned processes and tests to PATH, xdist workers '
+             'add their id to the file name.')
+    group.addoption(
+        '--spawner-stall-threshold', action='store', dest='spawner_stall_threshold',
+        type=float, default=DEFAULT_STALL_THRESHOLD, metavar='SECONDS',
+        help='warn about event listeners blocking the spawner loop longer than SECONDS '
+             '(default: %(default)s).')
+    group.addoption(
+        '--spawner-metrics', action='store', dest='spawner_metrics', default=None, metavar='PATH',
+        help='write spawner counters and gauges in the Prometheus text format to PATH '
+             'at the end of the session.')
 
 
 def pytest_configure(config):
@@ -32,17 +104,90 @@ class SpawnerPlugin(object):
     """Create process registry that should spawn new processes and kill existing."""
 
     def __init__(self, config):
-        self._manager = Manager()
+        # pytest-xdist workers have `workerinput` (`slaveinput` in old versions)
+        workerinput = getattr(config, 'workerinput', None) or getattr(config, 'slaveinput', None)
+        worker_id = workerinput.get('workerid') if workerinput else None
+
+        forkserver = config.getoption('spawner_forkserver', None)
+        if forkserver is not None:
+            forkserver = [module for module in forkserver.split(',') if module]
+
+        options = dict(
+            forkserver=forkserver,
+            sample_interval=config.getoption('spawner_sample_interval', None),
+            stall_threshold=config.getoption('spawner_stall_threshold', DEFAULT_STALL_THRESHOLD))
+        if config.getoption('spawner_supervisor', False):
+            self._manager = RemoteManager(namespace=worker_id, **options)
+        else:
+            self._manager = Manager(namespace=worker_id, **options)
+        self._shared = None
+        if worker_id is not None and config.getoption('spawner_xdist', 'isolate') == 'share':
+            testrun_id = workerinput.get('testrunuid') or str(os.getppid())
+            self._shared = SharedRegistry(
+                os.path.join(tempfile.gettempdir(), 'pytest-spawner-%s' % testrun_id), worker_id)
+
+        self._trace = None
+        self._trace_path = config.getoption('spawner_trace', None)
+        if self._trace_path is not None:
+            self._trace = TraceRecorder(self._manager)
+            if worker_id is not None:
+                root, ext = os.path.splitext(self._trace_path)
+                self._trace_path = '%s-%s%s' % (root, worker_id, ext)
 
     def pytest_configure(self, config):
         config._spawner_manager = self._manager
+        config._spawner_shared = self._shared
+        config._spawner_services = {}
 
     def pytest_sessionstart(self, session):
         self._manager.start()
+        if self._trace is not None:
+            self._trace.start()
+
+    def pytest_sessionfinish(self, session):
+        if self._shared is not None and self._manager.started:
+            # shared services started here outlive their fixtures until the
+            # other workers are done with them
+            try:
+                self._shared.finish()
+            except TimeoutError as exc:
+                logging.getLogger('spawner').warning('%s', exc)
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        if self._trace is not None:
+            self._trace.begin_test(nodeid)
+
+    def pytest_runtest_logreport(self, report):
+        if self._trace is not None and report.when == 'teardown':
+            self._trace.end_test(report.nodeid)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        config = terminalreporter.config
+        count = config.getoption('spawner_durations', None)
+        path = config.getoption('spawner_durations_json', None)
+        if (count is None and path is None) or not self._manager.started:
+            return
+
+        records = self._manager.get_timings()
+        if count is not None:
+            terminalreporter.write_sep('=', 'spawner process durations')
+            for line in summary_lines(records, count) or ['no process exited']:
+                terminalreporter.write_line(line)
+        if path is not None:
+            for record in records:
+                record['durations'] = durations(record['phases'])
+            with open(path, 'w') as f_json:
+                json.dump(records, f_json, indent=2, sort_keys=True)
 
     def pytest_unconfigure(self, config):
         if self._manager.started:
+            path = config.getoption('spawner_metrics', None)
+            if path is not None:
+                with open(path, 'w') as f_metrics:
+                    f_metrics.write(format_prometheus(self._manager.stats()))
             self._manager.stop()
+            if self._trace is not None:
+                self._trace.write(self._trace_path)
 
 
 class ProcessWatcher(object):
@@ -51,6 +196,7 @@ class ProcessWatcher(object):
         self._manager = manager
         self._buffers = collections.defaultdict(StringBuffer)
         self._future = Future()
+        self._spawned = Future()
         self._logger = logging.getLogger('spawner.%s' % name)
 
         self._redirect_stdout = False
@@ -67,6 +213,10 @@ class ProcessWatcher(object):
 
         self._ignore_exit_status = kwargs.pop('ignore_exit_status', False)
 
+        self._messages = collections.deque()
+        self._receivers = collections.deque()
+        self._messages_lock = threading.Lock()
+
         self._config = ProcessConfig(name, cmd, **kwargs)
         self._closed = False
 
@@ -90,7 +240,28 @@ class ProcessWatcher(object):
         elif self._redirect_stderr and evtype[-1] == 'stderr':
             self._buffer_to_log(buf, logging.ERROR)
 
+    def _on_message(self, evtype, data):
+        with self._messages_lock:
+            if not self._receivers:
+                self._messages.append(data['data'])
+                return
+            future = self._receivers.popleft()
+        future.set_result(data['data'])
+
+    def _on_spawn(self, evtype, data):
+        if not self._spawned.done():
+            self._spawned.set_result(data['os_pid'])
+
     def _on_exit(self, evtype, data):
+        if not self._spawned.done():
+            self._spawned.set_exception(
+                data['exception'] or ProcessError(self._config.cmd, data['exit_status'], data['term_signal']))
+
+        with self._messages_lock:
+            receivers, self._receivers = self._receivers, collections.deque()
+        for future in receivers:
+            future.cancel()
+
         stdout_data = self._buffers['stdout'].read_all()
         stderr_data = self._buffers['stderr'].read_all()
 
@@ -108,12 +279,58 @@ class ProcessWatcher(object):
             self._future.set_result({
                 'stdout': stdout_data if not self._redirect_stdout else None,
                 'stderr': stderr_data if not self._redirect_stderr else None,
-                'exit_status': data['exit_status']
+                'exit_status': data['exit_status'],
+                'term_signal': data['term_signal'],
+                'rusage': data.get('rusage'),
+                'run_time': data.get('run_time')
             })
 
         if self._closed:
-            self._manager.unsubscribe(self._config.exit_evtype, self._on_exit)
-            self._manager.unsubscribe(self._config.read_evtype, self._on_read)
+            self._unsubscribe()
+
+    def _unsubscribe(self):
+        self._manager.unsubscribe(self._config.spawn_evtype, self._on_spawn)
+        self._manager.unsubscribe(self._config.exit_evtype, self._on_exit)
+        self._manager.unsubscribe(self._config.read_evtype, self._on_read)
+        self._manager.unsubscribe(self._config.message_evtype, self._on_message)
+
+    @property
+    def resources(self):
+        """Values of `{port}`-style placeholders used by the process."""
+        return self._manager.get_resources(self._config.name)
+
+    @property
+    def listen_addresses(self):
+        """Addresses of sockets bound for the process with `listen` setting."""
+        return self._manager.get_listen_addresses(self._config.name)
+
+    def send(self, data):
+        """Send a message to the process IPC channel, requires `ipc=True`."""
+        self._manager.send_message(self._config.name, data)
+
+    def receive(self):
+        """Return a future resolved with the next message from the process."""
+        future = Future()
+        with self._messages_lock:
+            if not self._messages:
+                self._receivers.append(future)
+                return future
+            data = self._messages.popleft()
+        future.set_result(data)
+        return future
+
+    def recv(self, timeout=None):
+        """Wait for the next message from the process."""
+        future = self.receive()
+        try:
+            return future.result(timeout=timeout or DEFAULT_TIMEOUT)
+        except TimeoutError:
+            with self._messages_lock:
+                if future in self._receivers:
+                    self._receivers.remove(future)
+                    raise
+            # the message arrived in the meantime
+            return future.result()
 
     def start(self):
         self._manager.load(self._config, start=False)
@@ -122,20 +339,69 @@ class ProcessWatcher(object):
     def stop(self):
         self._manager.unload(self._config.name)
 
+    @property
+    def name(self):
+        return self._config.name
+
+    @property
+    def samples(self):
+        """`.sampler.Series` of the process by pid, needs `--spawner-sample-interval`."""
+        return self._manager.get_samples(self._config.name)
+
+    def assert_max(self, field, limit):
+        """Check a sampled value like ``'rss'`` never exceeded `limit`."""
+        for series in self.samples.values():
+            value = series.max(field)
+            if value is not None and value > limit:
+                raise AssertionError('%s of %s (pid %s) reached %s, the limit is %s' % (
+                    field, self._config.name, series.os_pid, value, limit))
+
+    def mark_ready(self):
+        """Record the process is ready for the durations summary."""
+        self._manager.mark_ready(self._config.name)
+
+    def pause(self):
+        """Stop the process with SIGSTOP, it won't use CPU until `resume`."""
+        self._manager.pause(self._config.name)
+
+    def resume(self):
+        self._manager.resume(self._config.name)
+
+    @property
+    def paused(self):
+        return self._manager.is_paused(self._config.name)
+
+    def detach(self):
+        """Leave the process running after the watcher is closed, see `SpawnerApi.persistent`."""
+        self._closed = True
+        self._manager.detach(self._config.name)
+        self._unsubscribe()
+
     def restart(self):
         self.stop()
+        self._spawned = Future()
         self.start()
         # reset future
         self._future.cancel()
         self._future = Future()
 
     def result(self, timeout=None):
+        """Wait for the exit and return output, exit status, run time and
+        ``rusage``, which is the usage of the process alone only if its
+        ``exact`` is true, see `.util.ChildrenUsage`.
+        """
         return self._future.result(timeout=timeout or DEFAULT_TIMEOUT)
 
+    def wait_spawn(self, timeout=None):
+        """Wait until the process is spawned and return its OS pid."""
+        return self._spawned.result(timeout=timeout or DEFAULT_TIMEOUT)
+
     def __enter__(self):
         assert not self._closed, "watcher already closed"
+        self._manager.subscribe(self._config.spawn_evtype, self._on_spawn)
         self._manager.subscribe(self._config.read_evtype, self._on_read)
         self._manager.subscribe(self._config.exit_evtype, self._on_exit)
+        self._manager.subscribe(self._config.message_evtype, self._on_message)
         self.start()
         return self
 
@@ -146,17 +412,23 @@ class ProcessWatcher(object):
 
 class SpawnerApi(object):
 
-    def __init__(self, manager):
+    def __init__(self, manager, shared=None, keep_alive_store=None, keep_alive=False):
         self._manager = manager
+        self._shared = shared
+        self._keep_alive_store = keep_alive_store
+        self._keep_alive = keep_alive
 
     def create(self, name, cmd, args=None, **kwargs):
+        return self._create(self._manager.qualify(name), cmd, args=args, **kwargs)
+
+    def _create(self, name, cmd, args=None, **kwargs):
         return ProcessWatcher(self._manager, name, cmd, args=args, **kwargs)
 
     def check(self, cmd, args=None, **kwargs):
         timeout = kwargs.pop("timeout", None)
-        name = os.path.basename(cmd)
+        name = self._manager.qualify(os.path.basename(cmd))
         assert not self._manager.exists(name), "process with name %s already exists" % name
-        with self.create(name, cmd, args=args, **kwargs) as watcher:
+        with self._create(name, cmd, args=args, **kwargs) as watcher:
             return watcher.result(timeout)
 
     def check_call(self, cmd, args=None, **kwargs):
@@ -165,6 +437,143 @@ class SpawnerApi(object):
     def check_output(self, cmd, args=None, **kwargs):
         return self.check(cmd, args=args, capture_stdout=True, redirect_stderr=True, **kwargs)['stdout']
 
+    def pipeline(self, cmds, pipefail=True, **kwargs):
+        """Run `cmds` connecting each process stdout to the next process stdin.
+
+        Every item of `cmds` is a command string or a `(cmd, args)` tuple. The
+        pipes are passed straight to the processes, so data never goes
+        through the interpreter. With `pipefail` the rightmost stage with a
+        non-zero exit status or killed by a signal fails the pipeline,
+        otherwise only the last process counts.
+        Returns stdout of the last process and the exit status and termination
+        signal of every stage.
+        """
+        timeout = kwargs.pop('timeout', None)
+        input_data = kwargs.pop('input', None)
+
+        stages = [(cmd, None) if isinstance(cmd, six.string_types) else tuple(cmd) for cmd in cmds]
+        assert stages, 'pipeline should have at least one command'
+
+        pipes = [make_pipe() for _ in stages[1:]]
+        watchers = []
+        try:
+            for index, (cmd, args) in enumerate(stages):
+                name = self._manager.qualify('%s.%d' % (os.path.basename(cmd), index))
+                assert not self._manager.exists(name), "process with name %s already exists" % name
+
+                stage_kwargs = dict(kwargs, redirect_stderr=True, ignore_exit_status=True)
+                if index == 0:
+                    stage_kwargs['input'] = input_data
+                else:
+                    stage_kwargs['stdin'] = pipes[index - 1][0]
+                if index < len(pipes):
+                    stage_kwargs['stdout'] = pipes[index][1]
+                else:
+                    stage_kwargs['capture_stdout'] = True
+
+                watcher = self._create(name, cmd, args=args, **stage_kwargs)
+                watcher.__enter__()
+                watchers.append(watcher)
+
+            results = [watcher.result(timeout) for watcher in watchers]
+        finally:
+            for watcher in reversed(watchers):
+                watcher.__exit__(None, None, None)
+            for reader, writer in pipes:
+                reader.close()
+                writer.close()
+
+        statuses = [result['exit_status'] for result in results]
+        signals = [result['term_signal'] for result in results]
+        # a stage killed by a signal, e.g. SIGPIPE, exits with status 0
+        failed = [index for index, status in enumerate(statuses) if status or signals[index]]
+        if not pipefail:
+            failed = [index for index in failed if index == len(stages) - 1]
+        if failed:
+            result = results[failed[-1]]
+            raise ProcessError(stages[failed[-1]][0], result['exit_status'], result['term_signal'])
+
+        return {
+            'stdout': results[-1]['stdout'],
+            'stderr': None,
+            'exit_status': statuses[-1],
+            'exit_statuses': statuses,
+            'term_signals': signals,
+            'rusages': [result['rusage'] for result in results]
+        }
+
+    def benchmark(self, cmd, args=None, warmup=DEFAULT_BENCHMARK_WARMUP,
+                  repeats=DEFAULT_BENCHMARK_REPEATS, concurrency=1, baseline=None,
+                  tolerance=DEFAULT_TOLERANCE, **kwargs):
+        """Run `cmd` `warmup` + `repeats` times, `concurrency` at once, and
+        return `.benchmark.summarize` statistics of the measured runs by
+        ``wall_time``, ``cpu_time`` and ``max_rss``.
+
+        The wall time is measured by the manager loop from spawn to exit, so
+        the interpreter overhead around the process isn't part of it. CPU
+        time and max RSS come from the result rusage and are only reported
+        when they are the values of every single run: max RSS needs the
+        exact usage of the fork server, CPU time as well with `concurrency`,
+        see `.util.ChildrenUsage`. Statistics left out are listed with the
+        reason under ``skipped``. `baseline` is a result saved with
+        `.benchmark.save_results` or its path, a median slower by more than
+        `tolerance` raises `AssertionError`.
+        """
+        timeout = kwargs.pop('timeout', None)
+        samples = collections.defaultdict(list)
+        skipped = {}
+        remaining = warmup + repeats
+        while remaining:
+            watchers = []
+            try:
+                for index in range(min(concurrency, remaining)):
+                    name = self._manager.qualify('%s.bench.%d' % (os.path.basename(cmd), index))
+                    assert not self._manager.exists(name), "process with name %s already exists" % name
+                    watcher = self._create(
+                        name, cmd, args=args, capture_stdout=True, redirect_stderr=True, **kwargs)
+                    watcher.__enter__()
+                    watchers.append(watcher)
+                results = [watcher.result(timeout) for watcher in watchers]
+            finally:
+                for watcher in reversed(watchers):
+                    watcher.__exit__(None, None, None)
+
+            for result in results:
+                remaining -= 1
+                if remaining >= repeats:
+                    continue
+                samples['wall_time'].append(result['run_time'])
+                usage = result['rusage']
+                if usage is None:
+                    skipped['cpu_time'] = skipped['max_rss'] = 'no resource usage reported'
+                    continue
+                if usage['exact'] or concurrency == 1:
+                    samples['cpu_time'].append(usage['user_time'] + usage['system_time'])
+                else:
+                    skipped['cpu_time'] = 'concurrent runs are only separable with the fork server'
+                if usage['exact']:
+                    samples['max_rss'].append(usage['max_rss'])
+                else:
+                    skipped['max_rss'] = 'the RSS of a single run is only known with the fork server'
+
+        stats = dict(
+            (key, summarize(values)) for key, values in samples.items() if key not in skipped)
+        if baseline is not None:
+            if isinstance(baseline, six.string_types):
+                baseline = load_results(baseline)
+            regressions = compare(stats, baseline, tolerance)
+            assert not regressions, '%s regressed: %s' % (cmd, ', '.join(
+                '%s median %.6g, baseline %.6g' % (key, stats[key]['median'], baseline[key]['median'])
+                for key in regressions))
+        stats['skipped'] = skipped
+        return stats
+
+    def soak(self, cmd, args=None, cycles=DEFAULT_CYCLES, **kwargs):
+        """Run `cmd` `cycles` times and fail if file descriptors, loop handles
+        or manager maps grew, see `.soak.soak`.
+        """
+        return soak(self, self._manager, cmd, args=args, cycles=cycles, **kwargs)
+
     @contextlib.contextmanager
     def spawn(self, name, cmd, args=None, **kwargs):
         timeout = kwargs.pop("timeout", None)
@@ -174,8 +583,228 @@ class SpawnerApi(object):
         # check for result code
         watcher.result(timeout)
 
+    @contextlib.contextmanager
+    def shared(self, name, cmd, args=None, info=None, **kwargs):
+        """Run a service shared by all pytest-xdist workers with `--spawner-xdist=share`.
+
+        The first worker starts the service, the others get its connection
+        info: leased resources, listen addresses and the result of
+        `info(watcher)`, which should be json serializable. The worker that
+        started the service stops it at the end of its session, once the
+        other workers released it or `shared_timeout` expired. Without xdist
+        or in "isolate" mode the service is simply spawned in this process.
+        """
+        timeout = kwargs.pop('timeout', None)
+        shared_timeout = kwargs.pop('shared_timeout', DEFAULT_SHARED_TIMEOUT)
+
+        def describe(watcher):
+            return {
+                'resources': watcher.resources,
+                'listen_addresses': watcher.listen_addresses,
+                'info': info(watcher) if info is not None else None
+            }
+
+        if self._shared is None:
+            with self.spawn(name, cmd, args=args, timeout=timeout, **kwargs) as watcher:
+                yield SharedService(describe(watcher), watcher=watcher)
+            return
+
+        watchers = []
+
+        def start():
+            watcher = self._create(
+                name, cmd, args=args, redirect_stdout=True, redirect_stderr=True, **kwargs)
+            watcher.__enter__()
+            watchers.append(watcher)
+            return describe(watcher)
+
+        def stop():
+            watchers[0].__exit__(None, None, None)
+            watchers[0].result(timeout)
+
+        data, owner = self._shared.acquire(name, start)
+        try:
+            yield SharedService(data, owner, watchers[0] if watchers else None)
+        finally:
+            self._shared.release(name, owner, stop, shared_timeout)
+
+    def template(self, name, setup, mode='auto'):
+        """Register a template directory prepared once by `setup(path)`.
+
+        Every process using a `{template_<name>}` placeholder, in its cwd or
+        env for instance, gets a fresh copy of it on each start and restart.
+        Copies use reflinks when possible and are removed in background.
+        """
+        template = TemplateDir(name, setup, mode=mode)
+        self._manager.register_template(template)
+        return template
+
+    @contextlib.contextmanager
+    def persistent(self, name, cmd, args=None, health_check=None, info=None, keep_alive=None,
+                   **kwargs):
+        """Run a service that may outlive the session with `--spawner-keep-alive`.
+
+        The service is recorded in the pytest cache and the next session
+        reattaches to it when the command, its env and binary didn't change
+        and `health_check(service)` passes, otherwise the old process is
+        stopped and a new one is started. `health_check` is also polled until
+        a new service is healthy. Output of kept-alive services goes to log
+        files in the cache dir unless `stdout`/`stderr` are given.
+        """
+        timeout = kwargs.pop('timeout', None)
+        if keep_alive is None:
+            keep_alive = self._keep_alive
+        store = self._keep_alive_store
+        name = self._manager.qualify(name)
+
+        fingerprint = command_fingerprint(cmd, args, kwargs.get('env'), kwargs.get('cwd'))
+        record = store.get(name) if store is not None else None
+        if record is not None:
+            service = PersistentService(
+                record['os_pid'], record['info'], record['resources'], record['listen_addresses'],
+                reattached=True)
+            if (keep_alive and record['fingerprint'] == fingerprint and
+                    process_alive(record['os_pid'], record['start_time']) and
+                    (health_check is None or health_check(service))):
+                # nobody else may lease the ports the service listens on
+                self._manager.lock_ports(name, record.get('ports', []))
+                yield service
+                return
+
+            # stale service, replace it
+            stop_process(record['os_pid'], record['start_time'])
+            self._manager.discard_resources(name, record.get('paths', []))
+            store.remove(name)
+
+        if not keep_alive or store is None:
+            with self._create(name, cmd, args=args, redirect_stdout=True, redirect_stderr=True,
+                              **kwargs) as watcher:
+                yield self._start_persistent(watcher, health_check, info, timeout)
+            watcher.result(timeout)
+            return
+
+        kwargs.setdefault('stdout', store.log_path(name, 'stdout'))
+        kwargs.setdefault('stderr', store.log_path(name, 'stderr'))
+        watcher = self._create(name, cmd, args=args, detached=True, **kwargs)
+        watcher.__enter__()
+        try:
+            service = self._start_persistent(watcher, health_check, info, timeout)
+            ports, paths = kept_resources(service.resources)
+            store.put(name, {
+                'os_pid': service.os_pid,
+                'start_time': process_start_time(service.os_pid),
+                'fingerprint': fingerprint,
+                'info': service.info,
+                'resources': service.resources,
+                'listen_addresses': service.listen_addresses,
+                'ports': ports,
+                'paths': paths
+            })
+        except Exception:
+            watcher.__exit__(None, None, None)
+            raise
+
+        try:
+            yield service
+        finally:
+            watcher.detach()
+
+    def _start_persistent(self, watcher, health_check, info, timeout):
+        service = PersistentService(
+            watcher.wait_spawn(timeout), None, watcher.resources, watcher.listen_addresses,
+            watcher=watcher)
+
+        deadline = time.time() + (timeout or DEFAULT_TIMEOUT)
+        while health_check is not None and not health_check(service):
+            if time.time() > deadline:
+                raise SpawnerError('service %s is not healthy' % watcher.name)
+            time.sleep(HEALTH_CHECK_INTERVAL)
+        if health_check is not None:
+            watcher.mark_ready()
+
+        if info is not None:
+            service.info = info(service)
+        return service
+
+
+class _Service(object):
+    """A running service fixture, see `service_fixture`."""
+
+    def __init__(self, watcher, reset):
+        self.watcher = watcher
+        self.used = False
+        self.paused = False
+        self._reset = reset
+
+    def reset(self):
+        if self._reset is not None:
+            self._reset(self.watcher)
+
+
+def service_fixture(name, cmd, args=None, scope='session', reset=None, ready=None, **kwargs):
+    """Declare a fixture running a long-lived service, e.g. in conftest.py::
+
+        redis = service_fixture('redis', 'redis-server --port {port}',
+                                reset=lambda watcher: flushall(watcher.resources['port']))
+
+    The service is started once per `scope` ("session", "package", "module",
+    "class" or "worker", which is one xdist worker, i.e. its session) and
+    the fixture value is its `ProcessWatcher`. Instead of a restart,
+    `reset(watcher)` is called before every test using the fixture after
+    the first one. `ready(watcher)` is polled after start until it's true.
+    """
+    timeout = kwargs.pop('timeout', None)
+
+    @pytest.fixture(scope='session' if scope == 'worker' else scope)
+    def fixture(request, spawner):
+        services = request.config._spawner_services
+        with spawner.spawn(name, cmd, args=args, timeout=timeout, **kwargs) as watcher:
+            deadline = time.time() + (timeout or DEFAULT_TIMEOUT)
+            while ready is not None and not ready(watcher):
+                if time.time() > deadline:
+                    raise SpawnerError('service %s is not ready' % watcher.name)
+                time.sleep(HEALTH_CHECK_INTERVAL)
+            if ready is not None:
+                watcher.mark_ready()
+
+            services[request.fixturename] = _Service(watcher, reset)
+            try:
+                yield watcher
+            finally:
+                services.pop(request.fixturename, None)
+
+    return fixture
+
+
+@pytest.fixture(autouse=True)
+def spawner_services(request):
+    """Reset service fixtures used by the test, see `service_fixture`.
+
+    With `--spawner-auto-pause` services the test doesn't use are paused.
+    """
+    services = request.config._spawner_services
+    auto_pause = request.config.getoption('spawner_auto_pause', False)
+    for fixturename, service in list(services.items()):
+        if fixturename not in request.fixturenames:
+            if auto_pause and not service.paused:
+                service.watcher.pause()
+                service.paused = True
+            continue
+
+        if service.paused:
+            service.watcher.resume()
+            service.paused = False
+        if service.used:
+            service.reset()
+        service.used = True
+
 
 @pytest.fixture(scope="session")
 def spawner(request):
     """Returns an API to access and control spawner."""
-    return SpawnerApi(request.config._spawner_manager)
+    config = request.config
+    cache = getattr(config, 'cache', None)
+    store = KeepAliveStore(str(cache.makedir('spawner'))) if cache is not None else None
+    return SpawnerApi(
+        config._spawner_manager, config._spawner_shared, store,
+        config.getoption('spawner_keep_alive', False))
@@ -2,18 +2,81 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import io
 import os
 import errno
 import shlex
+import socket
+import signal
 import logging
+import functools
 
 import six
 import pyuv
 
-from .util import getcwd, set_nonblocking
+from six.moves import cPickle as pickle
+
+from .util import (
+    getcwd, which, monotonic, set_nonblocking, set_cloexec, BufferPool, ChildrenUsage)
+from .ipc import IPC_FD_ENV, MessageDecoder, encode_message
+from .activation import wrap_command
+from .resources import find_placeholders
+from .forkserver import forkable, supported as forkserver_supported
+from .error import SpawnerError
 
 pyuv.Process.disable_stdio_inheritance()
 
+# initial and maximum size of a single read while draining a closing pipe
+SPECULATIVE_READ_MIN_SIZE = 8192
+SPECULATIVE_READ_MAX_SIZE = 1024 * 1024
+
+_read_buffers = BufferPool()
+
+# resource usage of exited processes, see `ChildrenUsage`
+_children_usage = ChildrenUsage()
+
+# size of chunks taken from a file or bytes passed as process input
+INPUT_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_input(source):
+    """Split process input (bytes, binary file or iterable of bytes) into chunks."""
+    if isinstance(source, six.binary_type):
+        return (source[offset:offset + INPUT_CHUNK_SIZE]
+                for offset in six.moves.range(0, len(source), INPUT_CHUNK_SIZE))
+    if hasattr(source, 'read'):
+        return iter(functools.partial(source.read, INPUT_CHUNK_SIZE), b'')
+    return iter(source)
+
+
+class PipeEnd(object):
+    """One end of an OS pipe that is handed over to a spawned process.
+
+    The process takes ownership of the descriptor and closes the parent copy
+    right after spawn, so the other end sees EOF as soon as the child exits.
+    """
+
+    def __init__(self, fd):
+        self._fd = fd
+
+    def take(self):
+        if self._fd is None:
+            raise ValueError('pipe end already taken')
+        fd, self._fd = self._fd, None
+        return fd
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self.take())
+
+
+def make_pipe():
+    """Create a pipe to connect one process stdout to another process stdin."""
+    read_fd, write_fd = os.pipe()
+    set_cloexec(read_fd)
+    set_cloexec(write_fd)
+    return PipeEnd(read_fd), PipeEnd(write_fd)
+
 
 class Stream(object):
     """Create stream to pass into subprocess."""
@@ -29,7 +92,16 @@ class Stream(object):
         evtype_suffix = (self._label, )
         self.read_evtype = config.read_evtype + evtype_suffix
         self.write_evtype = config.write_evtype + evtype_suffix
-        self.writelines_evtype = config.write_evtype + evtype_suffix
+        self.writelines_evtype = config.writelines_evtype + evtype_suffix
+        self.drain_evtype = config.drain_evtype + evtype_suffix
+
+        self._input = None
+        self._written = 0
+        self._metric_labels = (('stream', label), )
+
+    @property
+    def label(self):
+        return self._label
 
     @property
     def stdio(self):
@@ -43,31 +115,105 @@ class Stream(object):
     def _on_writelines(self, evtype, data):
         self._channel.writelines(data)
 
+    def feed(self, source):
+        """Write `source` into the pipe and close it once everything is written.
+
+        Only one chunk is in flight at a time, so the pipe applies backpressure
+        and memory use doesn't depend on the input size.
+        """
+        self._input = _iter_input(source)
+        self._written = 0
+        self._feed_next()
+
+    def _feed_next(self):
+        for chunk in self._input:
+            if chunk:
+                self._channel.write(chunk, functools.partial(self._on_fed, len(chunk)))
+                return
+        self._input = None
+        self._channel.shutdown(self._on_drain)
+
+    def _on_fed(self, size, handle, error):
+        if error is not None:
+            # the process doesn't read input anymore, just like communicate()
+            self._input = None
+            self._on_drain(handle, error)
+            return
+
+        self._written += size
+        if not self._channel.closed:
+            self._feed_next()
+
+    def _on_drain(self, handle, error):
+        if self._process is None:
+            return
+
+        msg = dict(
+            event=self.drain_evtype, name=self._process.name, stream=self,
+            pid=self._process.pid, written=self._written, error=error)
+        self._emitter.publish(self.drain_evtype, msg)
+
     def _on_read(self, handle, data, error):
         if not data:
             return
 
+        if 'first_output' not in self._process.timings:
+            self._process.timings['first_output'] = monotonic()
+        if self._process.metrics is not None:
+            self._process.metrics.inc('read_bytes_total', len(data), self._metric_labels)
+
         msg = dict(
             event=self.read_evtype, name=self._process.name, stream=self,
             pid=self._process.pid, data=data)
         self._emitter.publish(self.read_evtype, msg)
 
     def speculative_read(self):
+        """Drain data left in the pipe and publish it as a single event.
+
+        The read size doubles every time the pipe fills the whole buffer, so
+        large leftovers are drained with few syscalls into a pooled buffer.
+        """
+        if self._label == 'stdin':
+            # nothing is read from it and unread input resets the socketpair
+            return
+
         fd = self._channel.fileno()
         set_nonblocking(fd)
-        while True:
-            try:
-                buf = os.read(fd, 8192)
-            except (OSError, IOError) as exc:
-                if exc.errno != errno.EAGAIN:
-                    raise
-                buf = None
-            if not buf:
-                return
-            self._on_read(self._channel, buf, None)
+        reader = io.FileIO(fd, 'rb', closefd=False)
+        buf = _read_buffers.acquire(SPECULATIVE_READ_MIN_SIZE)
+        filled = 0
+        try:
+            while True:
+                if filled == len(buf):
+                    if len(buf) < SPECULATIVE_READ_MAX_SIZE:
+                        # the pipe keeps up with us, read more at once
+                        bigger = _read_buffers.acquire(len(buf) * 2)
+                        bigger[:filled] = buf[:filled]
+                        _read_buffers.release(buf)
+                        buf = bigger
+                    else:
+                        self._on_read(self._channel, memoryview(buf)[:filled].tobytes(), None)
+                        filled = 0
+
+                try:
+                    nbytes = reader.readinto(memoryview(buf)[filled:])
+                except (OSError, IOError) as exc:
+                    # libuv pipes are socketpairs, a reset one has no more data
+                    if exc.errno not in (errno.EAGAIN, errno.ECONNRESET, errno.EPIPE):
+                        raise
+                    nbytes = None
+                if not nbytes:
+                    break
+                filled += nbytes
+
+            if filled:
+                self._on_read(self._channel, memoryview(buf)[:filled].tobytes(), None)
+        finally:
+            _read_buffers.release(buf)
 
     def start(self):
-        self._channel.start_read(self._on_read)
+        if self._label != 'stdin':
+            self._channel.start_read(self._on_read)
         self._emitter.subscribe(self.write_evtype, self._on_write)
         self._emitter.subscribe(self.writelines_evtype, self._on_writelines)
 
@@ -75,6 +221,7 @@ class Stream(object):
         self._emitter.unsubscribe(self.write_evtype, self._on_write)
         self._emitter.unsubscribe(self.writelines_evtype, self._on_writelines)
 
+        self._input = None
         if not self._channel.closed:
             self._channel.close()
 
@@ -84,6 +231,40 @@ class Stream(object):
         return '<Stream: label={0._label!r} active={0._channel.active!r}>'.format(self)
 
 
+class MessageStream(Stream):
+    """Stream carrying length-prefixed messages, see `.ipc`."""
+
+    def __init__(self, loop, emitter, process, label):
+        super(MessageStream, self).__init__(loop, emitter, process, label)
+        config = self._process.config
+        self.message_evtype = config.message_evtype
+        self.send_evtype = config.send_evtype
+        self._decoder = MessageDecoder()
+
+    def _on_send(self, evtype, data):
+        if data['pid'] is None or data['pid'] == self._process.pid:
+            self._channel.write(encode_message(data['data']))
+
+    def _on_read(self, handle, data, error):
+        if not data:
+            return
+
+        self._decoder.feed(data)
+        for payload in self._decoder.messages():
+            msg = dict(
+                event=self.message_evtype, name=self._process.name, stream=self,
+                pid=self._process.pid, data=payload)
+            self._emitter.publish(self.message_evtype, msg)
+
+    def start(self):
+        super(MessageStream, self).start()
+        self._emitter.subscribe(self.send_evtype, self._on_send)
+
+    def stop(self):
+        self._emitter.unsubscribe(self.send_evtype, self._on_send)
+        super(MessageStream, self).stop()
+
+
 class ProcessConfig(object):
     """Object to maintain a process config."""
 
@@ -93,11 +274,22 @@ class ProcessConfig(object):
         "cwd": None,
         "capture_stdin": False,
         "capture_stdout": False,
-        "capture_stderr": False
+        "capture_stderr": False,
+        "stdin": None,
+        "stdout": None,
+        "stderr": None,
+        "input": None,
+        "ipc": False,
+        "detached": False
     }
 
     def __init__(self, name, cmd, **settings):
         assert isinstance(cmd, six.string_types), "cmd should be string, use args instead"
+        for label in ('stdin', 'stdout', 'stderr'):
+            assert not (settings.get(label) is not None and settings.get('capture_' + label)), \
+                "can't use %s with capture_%s" % (label, label)
+        assert settings.get('input') is None or settings.get('stdin') is None, \
+            "can't use input with stdin"
         self.name = name
         self.cmd = cmd
         self.settings = settings
@@ -110,23 +302,91 @@ class ProcessConfig(object):
         self.read_evtype = self.evtype_prefix + ('read', )
         self.write_evtype = self.evtype_prefix + ('write', )
         self.writelines_evtype = self.evtype_prefix + ('writelines', )
+        self.drain_evtype = self.evtype_prefix + ('drain', )
 
-    def make_process(self, loop, emitter, pid, label, env=None, on_exit=None):
+        self.message_evtype = self.evtype_prefix + ('message', )
+        self.send_evtype = self.evtype_prefix + ('send', )
+
+    def placeholders(self):
+        """Names of resources referred in cmd, args, env and cwd, see `.resources`."""
+        return find_placeholders(
+            self.cmd, self.settings.get('args'), self.settings.get('env'), self.settings.get('cwd'))
+
+    def compile(self, resources=None):
+        """Prepare everything a spawn needs once, see `SpawnTemplate`.
+
+        `resources` is the `.resources.Lease` substituted into placeholders.
+        """
         params = {}
         for name, default in self.DEFAULT_PARAMS.items():
             params[name] = self.settings.get(name, default)
 
-        os_env = self.settings.get('os_env', False)
-        if os_env:
-            env = params.get('env') or {}
+        cmd = self.cmd
+        if resources is not None:
+            cmd = resources.substitute(cmd)
+            for name in ('args', 'env', 'cwd'):
+                params[name] = resources.substitute(params[name])
+
+        env = dict(params['env'] or {})
+        if self.settings.get('os_env', False):
             env.update(os.environ)
-            params['env'] = env
 
-        if env is not None:
-            params['env'].update(env)
+        if params['input'] is not None:
+            params['capture_stdin'] = True
+
+        cmd, args = split_command(cmd, params.pop('args'))
+        executable = which(cmd, env.get('PATH')) or cmd
+        del params['env']
+        cwd = params.pop('cwd') or getcwd()
+        return SpawnTemplate(self, executable, args, env, cwd, params)
+
+    def make_process(self, loop, emitter, pid, label, env=None, on_exit=None, listen_fds=None,
+                     resources=None, forkserver=None):
+        return self.compile(resources).make_process(
+            loop, emitter, pid, label, env=env, on_exit=on_exit, listen_fds=listen_fds,
+            forkserver=forkserver)
 
-        params['on_exit_cb'] = on_exit
-        return Process(loop, emitter, self, pid, label, self.cmd, **params)
+
+def split_command(cmd, args=None):
+    """Return the executable and the argv of a command."""
+    cmd = six.u(cmd)
+    if args is not None:
+        if isinstance(args, six.string_types):
+            return cmd, shlex.split(six.u(args))
+        return cmd, [six.b(arg) for arg in args]
+
+    splitted_args = shlex.split(cmd)
+    if len(splitted_args) > 1:
+        cmd = splitted_args[0]
+    return cmd, splitted_args
+
+
+class SpawnTemplate(object):
+    """Spawn parameters of a config compiled by `ProcessConfig.compile`.
+
+    The argv is split and the executable looked up once, the environment is
+    a base shared by every process, a process only keeps its own additions.
+    A template is never modified, states keep one for all their spawns
+    unless every process gets its own template copies.
+    """
+
+    def __init__(self, config, cmd, args, env, cwd, params):
+        self.config = config
+        self.cmd = cmd
+        self.args = tuple(args)
+        self.env = env
+        self.cwd = cwd
+        self.params = params
+
+    def make_process(self, loop, emitter, pid, label, env=None, on_exit=None, listen_fds=None,
+                     forkserver=None):
+        """Create a process, `env` is added to the environment of this process only."""
+        params = dict(self.params, env=env, on_exit_cb=on_exit, listen_fds=listen_fds)
+        if forkserver is not None and self.config.settings.get('forkserver', False):
+            return ForkedProcess(
+                loop, emitter, self.config, pid, label, self.cmd, template=self,
+                forkserver=forkserver, **params)
+        return Process(loop, emitter, self.config, pid, label, self.cmd, template=self, **params)
 
 
 class Process(object):
@@ -134,7 +394,9 @@ class Process(object):
 
     def __init__(self, loop, emitter, config, pid, name, cmd,
                  args=None, env=None, cwd=None, on_exit_cb=None,
-                 capture_stdin=None, capture_stderr=None, capture_stdout=None):
+                 capture_stdin=None, capture_stderr=None, capture_stdout=None,
+                 stdin=None, stdout=None, stderr=None, input=None, ipc=False,
+                 listen_fds=None, detached=False, template=None):
         self._loop = loop
         self._emitter = emitter
 
@@ -142,56 +404,124 @@ class Process(object):
         self.pid = pid
         self.name = name
 
-        # set command
-        self._cmd = six.u(cmd)
-        if args is not None:
-            if isinstance(args, six.string_types):
-                self._args = shlex.split(six.u(args))
-            else:
-                self._args = [six.b(arg) for arg in args]
-
+        # set command, the environment of a process is the base environment
+        # with its own additions layered on top, see `spawn_env`
+        if template is not None:
+            self._cmd, self._args = template.cmd, list(template.args)
+            self._base_env = template.env
+            self._cwd = template.cwd
         else:
-            splitted_args = shlex.split(self._cmd)
-            if len(splitted_args) > 1:
-                self._cmd = splitted_args[0]
-            self._args = splitted_args
-
-        self._env = env or {}
-        self._cwd = cwd or getcwd()
-
+            self._cmd, self._args = split_command(cmd, args)
+            self._base_env = {}
+            self._cwd = cwd or getcwd()
+        self._env = dict(env or {})
+
+        self._listen_fds = listen_fds or []
+        if self._listen_fds:
+            self._cmd, self._args = wrap_command(self._cmd, self._args)
+            self._env['LISTEN_FDS'] = str(len(self._listen_fds))
+
+        self._input = input
+        self._ipc = ipc
+        self._detached = detached
         self._on_exit_cb = on_exit_cb
         self._process = None
         self._stdio = []
         self._streams = []
+        self._redirects = []
+        self._owned_fds = []
         self._stopped = False
         self._running = False
         self._logger = logging.getLogger("spawner.%s.%s" % (self.config.name, self.pid))
 
         self._captures = (
-            ('stdin', capture_stdin),
-            ('stdout', capture_stdout),
-            ('stderr', capture_stderr)
+            ('stdin', capture_stdin, stdin),
+            ('stdout', capture_stdout, stdout),
+            ('stderr', capture_stderr, stderr)
         )
 
         self.graceful_time = 0
         self.graceful_timeout = None
         self.once = False
+        self.paused = False
+
+        # monotonic time of lifecycle phases set by the manager, see `.timings`
+        self.timings = {}
+        # `.metrics.Metrics` of the manager
+        self.metrics = None
+        # `.resources.Lease` objects held until the process exited
+        self.leases = ()
 
         self._setup_stdio()
 
     def _setup_stdio(self):
         self._streams = []
         self._stdio = []
-        for fd, (name, capture) in enumerate(self._captures):
+        self._redirects = []
+        for fd, (name, capture, target) in enumerate(self._captures):
             if capture:
                 stream = Stream(self._loop, self._emitter, self, name)
                 self._streams.append(stream)
                 self._stdio.append(stream.stdio)
+            elif target is not None:
+                # resolved right before spawn, see `_open_redirects`
+                self._redirects.append((fd, name, target))
+                self._stdio.append(None)
             elif name == "stdin":
                 self._stdio.append(pyuv.StdIO(flags=pyuv.UV_IGNORE))
             else:
                 self._stdio.append(pyuv.StdIO(fd=fd, flags=pyuv.UV_INHERIT_FD))
 
+        # inherited listening sockets start at descriptor 3
+        for listen_fd in self._listen_fds:
+            self._stdio.append(pyuv.StdIO(fd=listen_fd, flags=pyuv.UV_INHERIT_FD))
+
+        if self._ipc:
+            # libuv creates pipes as socket pairs, so both sides can write
+            stream = MessageStream(self._loop, self._emitter, self, 'ipc')
+            self._env[IPC_FD_ENV] = str(len(self._stdio))
+            self._streams.append(stream)
+            self._stdio.append(stream.stdio)
+
+    def _open_redirects(self):
+        """Connect redirected stdio straight to files or file descriptors.
+
+        A target can be a file descriptor, an object with a `fileno` method,
+        a `PipeEnd` or a path. Paths are opened here and, like pipe ends,
+        closed once the child has inherited them, outputs are appended to.
+        Other targets raise `SpawnerError`.
+        """
+        for fd, name, target in self._redirects:
+            if isinstance(target, PipeEnd):
+                target_fd = target.take()
+                self._owned_fds.append(target_fd)
+            elif isinstance(target, six.integer_types):
+                target_fd = target
+            elif hasattr(target, 'fileno'):
+                target_fd = target.fileno()
+            elif not isinstance(target, (six.string_types, six.binary_type)):
+                raise SpawnerError('unsupported %s target of %s: %r' % (name, self.name, target))
+            elif name == 'stdin':
+                target_fd = os.open(target, os.O_RDONLY)
+                self._owned_fds.append(target_fd)
+            else:
+                target_fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                self._owned_fds.append(target_fd)
+            self._stdio[fd] = pyuv.StdIO(fd=target_fd, flags=pyuv.UV_INHERIT_FD)
+
+    def _close_owned_fds(self):
+        while self._owned_fds:
+            os.close(self._owned_fds.pop())
+
+    @property
+    def spawn_env(self):
+        """The environment the process is spawned with."""
+        if not self._env:
+            return self._base_env
+        env = dict(self._base_env)
+        env.update(self._env)
+        return env
+
     @property
     def running(self):
         return self._running
@@ -213,14 +543,18 @@ class Process(object):
             executable=self._cmd,
             exit_callback=self._exit_cb,
             args=self._args,
-            env=self._env,
+            env=self.spawn_env,
             cwd=self._cwd,
             stdio=self._stdio)
+        if self._detached:
+            # own session, the process may outlive us
+            kwargs['flags'] = pyuv.UV_PROCESS_DETACHED
 
         # spawn the process
         try:
+            self._open_redirects()
             process = pyuv.Process.spawn(self._loop, **kwargs)
-        except pyuv.error.ProcessError as exc:
+        except (pyuv.error.ProcessError, SpawnerError, OSError, IOError) as exc:
             # handle the exit callback
             if self._on_exit_cb is not None:
                 self._on_exit_cb(
@@ -232,6 +566,11 @@ class Process(object):
             # start redirecting IO
             for stream in self._streams:
                 stream.start()
+                if stream.label == 'stdin' and self._input is not None:
+                    stream.feed(self._input)
+        finally:
+            # the child holds its own copies now
+            self._close_owned_fds()
 
     def kill(self, signum):
         """Stop the process using signal."""
@@ -242,13 +581,34 @@ class Process(object):
                 if exc.args[0] != pyuv.errno.UV_ESRCH:
                     self._logger.error("Unable to kill process %s.%s because %s" % (self.name, self.pid, exc.args[1]))
 
+    def pause(self):
+        """Stop the process with SIGSTOP until `resume` is called."""
+        if self._running and not self.paused:
+            self.kill(signal.SIGSTOP)
+            self.paused = True
+
+    def resume(self):
+        if self._running and self.paused:
+            self.kill(signal.SIGCONT)
+            self.paused = False
+
     def close(self):
         if self._process is not None:
             if self._running:
                 self._close()
             self._process.close()
 
-    def _close(self, exit_status=None, term_signal=None):
+    def detach(self):
+        """Forget the process without stopping it, no exit is reported."""
+        for stream in self._streams:
+            stream.stop()
+        self._on_exit_cb = None
+        self._running = False
+        if self._process is not None:
+            self._process.close()
+            self._process = None
+
+    def _close(self, exit_status=None, term_signal=None, rusage=None):
         for stream in self._streams:
             stream.speculative_read()
             stream.stop()
@@ -256,13 +616,15 @@ class Process(object):
         # handle the exit callback
         if self._on_exit_cb is not None:
             self._on_exit_cb(
-                self, exception=None, exit_status=exit_status, term_signal=term_signal)
+                self, exception=None, exit_status=exit_status, term_signal=term_signal,
+                rusage=rusage)
 
     def _exit_cb(self, handle, exit_status, term_signal):
         self._running = False
         self._process = None
         handle.close()
-        self._close(exit_status=exit_status, term_signal=term_signal)
+        self._close(
+            exit_status=exit_status, term_signal=term_signal, rusage=_children_usage.collect())
 
     def __lt__(self, other):
         return (self.pid != other.pid and
@@ -270,3 +632,120 @@ class Process(object):
 
     __cmp__ = __lt__
 
+
+class ForkedProcess(Process):
+    """Process forked by a `.forkserver.ForkServer` from a warmed up interpreter.
+
+    Commands the server can't run (not Python, detached, with listening
+    sockets) or a stopped or unresponsive server fall back to spawning like
+    `Process`.
+    """
+
+    def __init__(self, loop, emitter, config, pid, name, cmd, forkserver=None, **kwargs):
+        super(ForkedProcess, self).__init__(loop, emitter, config, pid, name, cmd, **kwargs)
+        self._forkserver = forkserver
+        self._forked_pid = None
+        self._conn = None
+        self._decoder = MessageDecoder()
+
+    def _can_fork(self, argv):
+        return (forkserver_supported() and self._forkserver is not None and
+                self._forkserver.running and not self._listen_fds and not self._detached and
+                forkable(self._cmd, argv))
+
+    @property
+    def os_pid(self):
+        if self._conn is None:
+            return super(ForkedProcess, self).os_pid
+        return self._forked_pid if self._running else None
+
+    def _child_fds(self):
+        """Descriptors the child gets as 0, 1, 2 and up, in `_stdio` order."""
+        fds = []
+        for stdio in self._stdio:
+            if stdio.flags & pyuv.UV_CREATE_PIPE:
+                parent, child = socket.socketpair()
+                stdio.stream.open(parent.detach())
+                fds.append(child.detach())
+                self._owned_fds.append(fds[-1])
+            elif stdio.flags & pyuv.UV_INHERIT_FD:
+                fds.append(stdio.fd)
+            else:
+                fds.append(os.open(os.devnull, os.O_RDWR))
+                self._owned_fds.append(fds[-1])
+        return fds
+
+    def spawn(self, once=False, graceful_timeout=None, env=None):
+        argv = [os.fsdecode(arg) for arg in self._args] if forkserver_supported() else None
+        if not self._can_fork(argv):
+            return super(ForkedProcess, self).spawn(once, graceful_timeout, env)
+
+        self.once = once
+        self.graceful_timeout = graceful_timeout
+
+        if env is not None:
+            self._env.update(env)
+
+        try:
+            self._open_redirects()
+            os_pid, sock = self._forkserver.fork(
+                argv, dict((str(key), str(value)) for key, value in self.spawn_env.items()),
+                self._cwd, self._child_fds())
+        except (SpawnerError, OSError, IOError) as exc:
+            if self._on_exit_cb is not None:
+                self._on_exit_cb(
+                    self, exception=exc, exit_status=None, term_signal=None)
+        else:
+            self._forked_pid = os_pid
+            self._conn = pyuv.Pipe(self._loop)
+            self._conn.open(sock.detach())
+            self._conn.start_read(self._on_server_read)
+            self._running = True
+
+            for stream in self._streams:
+                stream.start()
+                if stream.label == 'stdin' and self._input is not None:
+                    stream.feed(self._input)
+        finally:
+            self._close_owned_fds()
+
+    def _on_server_read(self, handle, data, error):
+        if data:
+            self._decoder.feed(data)
+            for payload in self._decoder.messages():
+                message = pickle.loads(payload)
+                if message[0] == 'exit' and self._running:
+                    # the server waits with wait4, the usage is exact
+                    self._exit(exit_status=message[1], term_signal=message[2], rusage=message[3])
+        elif error is not None and self._running:
+            # the server went away, the exit status is unknown
+            self._exit()
+
+    def _exit(self, exit_status=None, term_signal=None, rusage=None):
+        self._running = False
+        self._conn.close()
+        self._close(exit_status=exit_status, term_signal=term_signal, rusage=rusage)
+
+    def kill(self, signum):
+        if self._conn is None:
+            return super(ForkedProcess, self).kill(signum)
+        if self._running:
+            try:
+                os.kill(self._forked_pid, signum)
+            except OSError as exc:
+                if exc.errno != errno.ESRCH:
+                    self._logger.error("Unable to kill process %s.%s because %s" % (self.name, self.pid, exc))
+
+    def close(self):
+        if self._conn is None:
+            return super(ForkedProcess, self).close()
+        if self._running:
+            self._running = False
+            self._close()
+        if not self._conn.closed:
+            self._conn.close()
+
+    def detach(self):
+        super(ForkedProcess, self).detach()
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
@@ -0,0 +1,323 @@
+# coding: utf-8
+"""Allocation of ports, temporary directories and unix socket paths.
+
+Commands, args, env values and cwd of a process config can refer to
+resources with `{port}`, `{tmpdir}` and `{socket}` placeholders, optionally
+suffixed to get several of a kind (`{port_http}`, `{port_admin}`).
+`{template_<name>}` is a copy of the registered template directory `name`,
+see `.template`, checked out for every spawned process, the other resources
+are leased once per config and kept over restarts. Ports are guarded by file
+locks in a directory shared by every pytest process on the host, so parallel
+sessions never lease the same port. Ports of detached processes stay locked
+until the session ends, the next session locks them again when it reattaches
+to the processes, see `kept_resources`.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import re
+import errno
+import fcntl
+import shutil
+import socket
+import tempfile
+import threading
+
+import six
+
+PLACEHOLDER_RE = re.compile(r'\{((port|tmpdir|socket|template)(?:_\w+)?)\}')
+
+MAX_PORT_ATTEMPTS = 100
+
+# kinds of resources leased for every process instead of once per config
+PER_PROCESS_KINDS = frozenset(['template'])
+
+
+def find_placeholders(*values):
+    """Return names of resource placeholders used in strings of `values`."""
+    names = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, six.string_types):
+            value = [value]
+        elif isinstance(value, dict):
+            value = value.values()
+        for item in value:
+            if isinstance(item, six.string_types):
+                names.update(match.group(1) for match in PLACEHOLDER_RE.finditer(item))
+    return names
+
+
+def split_placeholders(names):
+    """Placeholders leased per config and the ones leased per process."""
+    per_process = set(name for name in names if name.split('_', 1)[0] in PER_PROCESS_KINDS)
+    return set(names) - per_process, per_process
+
+
+def kept_resources(values):
+    """Ports and paths of the resource `values` of a detached process, to
+    lock the ports again with `ResourceAllocator.lock_ports` and remove the
+    paths with `ResourceAllocator.discard` once the process is replaced.
+    """
+    ports, paths = [], []
+    for key, value in values.items():
+        kind = key.split('_', 1)[0]
+        if kind == 'port':
+            ports.append(value)
+        elif kind == 'socket':
+            paths.append(os.path.dirname(value))
+        else:
+            paths.append(value)
+    return sorted(ports), sorted(paths)
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+class Lease(object):
+    """Resources leased for one process config or one process.
+
+    Running processes `hold` the lease, `release` waits until they `drop` it,
+    so ports and directories of a config unloaded for a restart stay with
+    the old process until it exited.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.values = {}
+        self._lock_fds = []
+        self._paths = []
+        self._copies = []
+        self._users = 0
+        self._released = False
+
+    def hold(self):
+        self._users += 1
+
+    def drop(self):
+        self._users -= 1
+        if not self._users and self._released:
+            self._free()
+
+    def substitute(self, value):
+        """Replace placeholders in a string, the strings of a list or the string
+        values of a dict, anything else is returned unchanged.
+        """
+        if isinstance(value, dict):
+            return dict((key, self._substitute_string(item)) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            return [self._substitute_string(item) for item in value]
+        return self._substitute_string(value)
+
+    def _substitute_string(self, value):
+        if isinstance(value, six.string_types):
+            return PLACEHOLDER_RE.sub(self._format, value)
+        return value
+
+    def _format(self, match):
+        try:
+            return six.text_type(self.values[match.group(1)])
+        except KeyError:
+            return match.group(0)
+
+    def release(self, keep_paths=False):
+        """Unlock ports and remove directories once no process holds the lease.
+
+        With `keep_paths` processes keep using the directories, ports are
+        unlocked right away.
+        """
+        self._released = True
+        if keep_paths or not self._users:
+            self._free(keep_paths)
+
+    def _free(self, keep_paths=False):
+        while self._lock_fds:
+            fd = self._lock_fds.pop()
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        while self._paths:
+            path = self._paths.pop()
+            if not keep_paths:
+                shutil.rmtree(path, ignore_errors=True)
+        while self._copies:
+            template, path = self._copies.pop()
+            if not keep_paths:
+                template.release(path)
+        self.values = {}
+
+
+class ResourceAllocator(object):
+    """Lease resources per process config, or per process with `checkout`."""
+
+    def __init__(self, lock_dir=None, host='127.0.0.1'):
+        self._lock_dir = lock_dir or os.path.join(tempfile.gettempdir(), 'pytest-spawner-locks')
+        self._host = host
+        self._leases = {}
+        self._templates = {}
+        # leases of detached processes by name, see `detach`
+        self._detached = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of leases."""
+        return len(self._leases)
+
+    def register_template(self, template):
+        """Make `template` available as `{template_<name>}` placeholder."""
+        with self._lock:
+            self._templates[template.name] = template
+
+    def lease(self, name, placeholders):
+        """Allocate resources named in `placeholders` for process config `name`.
+
+        A lease of a previous config with the same name is released by its
+        state, it may still be held by a process.
+        """
+        lease = self._allocate(Lease(name), placeholders)
+        with self._lock:
+            self._leases[name] = lease
+        return lease
+
+    def checkout(self, name, placeholders, base=None):
+        """Allocate resources for a single process, usually template copies,
+        the values of the `base` lease are available for substitution too.
+        """
+        lease = Lease(name)
+        if base is not None:
+            lease.values.update(base.values)
+        return self._allocate(lease, placeholders)
+
+    def _allocate(self, lease, placeholders):
+        name = lease.name
+        try:
+            for key in sorted(placeholders):
+                kind = key.split('_', 1)[0]
+                if kind == 'port':
+                    lease.values[key] = self._allocate_port(lease)
+                elif kind == 'template':
+                    with self._lock:
+                        template = self._templates.get(key[len('template_'):])
+                    if template is None:
+                        raise KeyError('unknown template in placeholder %r' % key)
+                    path = template.checkout()
+                    lease._copies.append((template, path))
+                    lease.values[key] = path
+                elif kind == 'tmpdir':
+                    path = tempfile.mkdtemp(prefix='spawner-%s-' % _safe_name(name))
+                    lease._paths.append(path)
+                    lease.values[key] = path
+                else:
+                    # keep socket paths short, unix socket path length is limited
+                    path = tempfile.mkdtemp(prefix='spawner-')
+                    lease._paths.append(path)
+                    lease.values[key] = os.path.join(path, '%s.sock' % key)
+        except Exception:
+            lease.release()
+            raise
+        return lease
+
+    def get(self, name):
+        with self._lock:
+            lease = self._leases.get(name)
+        return dict(lease.values) if lease is not None else {}
+
+    def release(self, name, lease=None):
+        """Release resources of `name`, or only `lease` if it is given."""
+        with self._lock:
+            if lease is None or self._leases.get(name) is lease:
+                lease = self._leases.pop(name, None)
+        if lease is not None:
+            lease.release()
+
+    def detach(self, name, lease):
+        """Leave `lease` to processes that keep running: its directories are
+        not removed and its ports stay locked until `discard` or `release_all`.
+        """
+        with self._lock:
+            if self._leases.get(name) is lease:
+                self._leases.pop(name)
+            self._detached.setdefault(name, []).append(lease)
+
+    def lock_ports(self, name, ports):
+        """Lock `ports` of a process `name` detached by a previous session like
+        `detach` does, ports locked by somebody else are skipped.
+        """
+        self._ensure_lock_dir()
+        lease = Lease(name)
+        for port in ports:
+            fd = self._lock_port(port)
+            if fd is not None:
+                lease._lock_fds.append(fd)
+        with self._lock:
+            self._detached.setdefault(name, []).append(lease)
+
+    def discard(self, name, paths=()):
+        """Unlock the ports of the detached processes `name` and remove their
+        directories and `paths`, once the processes are gone.
+        """
+        with self._lock:
+            leases = self._detached.pop(name, [])
+        for lease in leases:
+            lease._free()
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def release_all(self):
+        with self._lock:
+            leases, self._leases = list(self._leases.values()), {}
+            detached, self._detached = list(self._detached.values()), {}
+            templates, self._templates = list(self._templates.values()), {}
+        for lease in leases:
+            lease.release()
+        for lease in sum(detached, []):
+            # the detached processes keep using their directories
+            lease._free(keep_paths=True)
+        for template in templates:
+            template.close()
+
+    def _ensure_lock_dir(self):
+        if not os.path.isdir(self._lock_dir):
+            try:
+                os.makedirs(self._lock_dir)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+    def _lock_port(self, port):
+        """Descriptor of the locked lock file of `port`, None if somebody else
+        holds it.
+        """
+        lock_path = os.path.join(self._lock_dir, 'port-%d.lock' % port)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (OSError, IOError) as exc:
+            os.close(fd)
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return None
+        return fd
+
+    def _allocate_port(self, lease):
+        self._ensure_lock_dir()
+
+        for _ in six.moves.range(MAX_PORT_ATTEMPTS):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.bind((self._host, 0))
+                port = sock.getsockname()[1]
+            finally:
+                sock.close()
+
+            fd = self._lock_port(port)
+            if fd is None:
+                # somebody else holds this port, try another one
+                continue
+
+            lease._lock_fds.append(fd)
+            return port
+
+        raise RuntimeError('unable to allocate a free port')
@@ -0,0 +1,157 @@
+# coding: utf-8
+"""Sample CPU, memory and IO use of running processes from /proc.
+
+`Sampler` runs on the manager loop when the manager is created with
+`sample_interval`, every process gets a `Series`, e.g. to check a service
+doesn't leak memory::
+
+    series = manager.get_samples(name)[pid]
+    assert series.max('rss') < 100 * 1024 * 1024
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import time
+import array
+import logging
+
+import pyuv
+
+PROC_ROOT = '/proc'
+
+# values of a sample, times and cpu_time in seconds, the rest in bytes
+FIELDS = ('time', 'cpu_time', 'rss', 'read_bytes', 'write_bytes')
+_TYPECODES = ('d', 'd', 'q', 'q', 'q')
+
+_clock_ticks = os.sysconf(str('SC_CLK_TCK'))
+_page_size = os.sysconf(str('SC_PAGE_SIZE'))
+
+
+def supported():
+    return os.path.isdir(PROC_ROOT)
+
+
+def read_sample(os_pid):
+    """Read one sample of a process, returns None if it doesn't exist anymore."""
+    path = os.path.join(PROC_ROOT, str(os_pid))
+    try:
+        with open(os.path.join(path, 'stat'), 'rb') as f_stat:
+            stat = f_stat.read()
+        with open(os.path.join(path, 'statm'), 'rb') as f_statm:
+            statm = f_statm.read()
+    except (IOError, OSError):
+        return None
+
+    # the command name may contain spaces, fields after it are fixed
+    fields = stat[stat.rindex(b')') + 2:].split()
+    cpu_time = float(int(fields[11]) + int(fields[12])) / _clock_ticks
+    rss = int(statm.split()[1]) * _page_size
+
+    read_bytes = write_bytes = 0
+    try:
+        with open(os.path.join(path, 'io'), 'rb') as f_io:
+            for line in f_io:
+                key, _, value = line.partition(b':')
+                if key == b'read_bytes':
+                    read_bytes = int(value)
+                elif key == b'write_bytes':
+                    write_bytes = int(value)
+    except (IOError, OSError):
+        # needs the same user and ptrace access
+        pass
+
+    return (time.time(), cpu_time, rss, read_bytes, write_bytes)
+
+
+class Series(object):
+    """Samples of one process, each field is kept in an `array.array`."""
+
+    def __init__(self, name, pid, os_pid):
+        self.name = name
+        self.pid = pid
+        self.os_pid = os_pid
+        self._values = [array.array(str(code)) for code in _TYPECODES]
+
+    def append(self, sample):
+        for values, value in zip(self._values, sample):
+            values.append(value)
+
+    def __len__(self):
+        return len(self._values[0])
+
+    def values(self, field):
+        return self._values[FIELDS.index(field)]
+
+    def max(self, field):
+        values = self.values(field)
+        return max(values) if values else None
+
+    def last(self, field):
+        values = self.values(field)
+        return values[-1] if values else None
+
+    def cpu_percent(self):
+        """Average CPU use between the first and the last sample."""
+        times, cpu = self.values('time'), self.values('cpu_time')
+        if len(times) < 2 or times[-1] == times[0]:
+            return None
+        return 100.0 * (cpu[-1] - cpu[0]) / (times[-1] - times[0])
+
+    def copy(self):
+        series = Series(self.name, self.pid, self.os_pid)
+        series._values = [array.array(values.typecode, values) for values in self._values]
+        return series
+
+    def __repr__(self):
+        return '<Series: name={0.name!r} pid={0.pid!r} samples={1}>'.format(self, len(self))
+
+
+class Sampler(object):
+    """Sample running processes of a manager every `interval` seconds."""
+
+    def __init__(self, loop, interval, processes, lock):
+        self.interval = interval
+        self._processes = processes
+        self._lock = lock
+        self._series = {}
+        self._timer = pyuv.Timer(loop)
+
+    def start(self):
+        if not supported():
+            logging.warning('%s is not available, processes are not sampled', PROC_ROOT)
+            return
+        self._timer.start(self._on_sample, self.interval, self.interval)
+
+    def stop(self):
+        if not self._timer.closed:
+            self._timer.close()
+
+    def _on_sample(self, handle):
+        with self._lock:
+            running = [(process.name, process.pid, process.os_pid)
+                       for process in self._processes.values() if process.os_pid is not None]
+
+        # /proc is read without the lock, so manager calls don't wait on file IO
+        samples = [(name, pid, os_pid, read_sample(os_pid)) for name, pid, os_pid in running]
+
+        with self._lock:
+            for name, pid, os_pid, sample in samples:
+                # skip processes gone meanwhile, their series may be forgotten
+                if sample is None or pid not in self._processes:
+                    continue
+                series = self._series.setdefault(name, {}).get(pid)
+                if series is None:
+                    series = Series(name, pid, os_pid)
+                    self._series[name][pid] = series
+                series.append(sample)
+
+    def get(self, name):
+        """Copies of the series of processes of a config by their pid."""
+        with self._lock:
+            return dict(
+                (pid, series.copy()) for pid, series in self._series.get(name, {}).items())
+
+    def forget(self, name):
+        with self._lock:
+            self._series.pop(name, None)
@@ -0,0 +1,176 @@
+# coding: utf-8
+"""Share services between pytest-xdist workers of one test run.
+
+The first worker that asks for a service starts it and publishes connection
+info in a json file, the others only read it. Every worker registers itself
+as a user and the owner keeps the service running until all users left, it
+waits for them in `SharedRegistry.finish` at the end of its session.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import io
+import re
+import json
+import time
+import errno
+import fcntl
+import contextlib
+
+from .error import TimeoutError
+
+POLL_INTERVAL = 0.1
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno == errno.EPERM
+    return True
+
+
+class SharedService(object):
+    """Connection info of a shared service.
+
+    `watcher` is only set in the worker that started the service.
+    """
+
+    def __init__(self, info, owner=True, watcher=None):
+        self.info = info
+        self.owner = owner
+        self.watcher = watcher
+
+    @property
+    def resources(self):
+        return self.info['resources']
+
+    @property
+    def listen_addresses(self):
+        return self.info['listen_addresses']
+
+    def __repr__(self):
+        return '<SharedService: owner={0.owner!r} info={0.info!r}>'.format(self)
+
+
+class SharedRegistry(object):
+    """Coordinate shared services through files in `root`."""
+
+    def __init__(self, root, worker_id):
+        self._root = root
+        self._worker_id = worker_id
+        # stop callbacks and timeouts of the released services started here
+        self._stops = {}
+        if not os.path.isdir(root):
+            try:
+                os.makedirs(root)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+    def _path(self, name, suffix):
+        return os.path.join(self._root, re.sub(r'[^\w.-]', '_', name) + suffix)
+
+    @contextlib.contextmanager
+    def _locked(self, name):
+        fd = os.open(self._path(name, '.lock'), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _read_info(self, name):
+        try:
+            with io.open(self._path(name, '.json'), encoding='utf-8') as f_stream:
+                info = json.load(f_stream)
+        except (IOError, OSError, ValueError):
+            return None
+        # the owner worker died without cleaning up
+        if not _pid_exists(info['owner_pid']):
+            return None
+        return info
+
+    def _users(self, name):
+        users_dir = self._path(name, '.users')
+        try:
+            return os.listdir(users_dir)
+        except OSError:
+            return []
+
+    def acquire(self, name, start):
+        """Return `(info, owner)` of a shared service.
+
+        `start` is called to start the service if no worker did it yet, it
+        should return json serializable connection info.
+        """
+        with self._locked(name):
+            info = self._read_info(name)
+            owner = info is None
+            if owner:
+                info = {
+                    'owner': self._worker_id,
+                    'owner_pid': os.getpid(),
+                    'info': start()
+                }
+                tmp_path = self._path(name, '.json.tmp')
+                with io.open(tmp_path, 'w', encoding='utf-8') as f_stream:
+                    f_stream.write(json.dumps(info, ensure_ascii=False))
+                os.rename(tmp_path, self._path(name, '.json'))
+
+            users_dir = self._path(name, '.users')
+            if not os.path.isdir(users_dir):
+                os.mkdir(users_dir)
+            io.open(os.path.join(users_dir, self._worker_id), 'w').close()
+
+        return info['info'], owner
+
+    def release(self, name, owner, stop=None, timeout=None):
+        """Leave a shared service, the owner keeps it running for the other
+        users until `finish`, which calls `stop` within `timeout` seconds.
+        """
+        with self._locked(name):
+            try:
+                os.unlink(os.path.join(self._path(name, '.users'), self._worker_id))
+            except OSError:
+                pass
+
+        if owner:
+            self._stops[name] = (stop, timeout)
+
+    def finish(self):
+        """Stop the services started here once their other users left.
+
+        Services still used when their timeout expired are stopped anyway and
+        `TimeoutError` is raised after all of them were stopped.
+        """
+        now = time.time()
+        pending = dict(
+            (name, (stop, now + timeout if timeout is not None else None))
+            for name, (stop, timeout) in self._stops.items())
+        self._stops = {}
+
+        busy = []
+        while pending:
+            for name, (stop, deadline) in sorted(pending.items()):
+                with self._locked(name):
+                    users = self._users(name)
+                    expired = deadline is not None and time.time() > deadline
+                    if users and not expired:
+                        continue
+                    try:
+                        os.unlink(self._path(name, '.json'))
+                    except OSError:
+                        pass
+                if users:
+                    busy.append('%s (%s)' % (name, ', '.join(users)))
+                del pending[name]
+                if stop is not None:
+                    stop()
+            if pending:
+                time.sleep(POLL_INTERVAL)
+
+        if busy:
+            raise TimeoutError('shared services stopped while still in use: %s' % ', '.join(busy))
@@ -0,0 +1,144 @@
+# coding: utf-8
+"""Find descriptor and handle leaks of many spawns.
+
+A pipe or handle missed by one of the close paths of `.process.Process` and
+`.process.Stream` only shows up as ``EMFILE`` after thousands of spawns.
+`soak` runs a command over and over and compares an `audit` of the open file
+descriptors, the loop handles and the manager maps before and after,
+`growth` tells what was left behind::
+
+    python -m pytest_spawner.soak --cycles 10000 cat /etc/hostname
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import sys
+import time
+import argparse
+
+from .util import monotonic
+
+FD_DIR = '/proc/self/fd'
+
+DEFAULT_CYCLES = 1000
+DEFAULT_WARMUP = 10
+DEFAULT_SETTLE_TIMEOUT = 5.0
+SETTLE_INTERVAL = 0.05
+
+# maps bounded by the manager itself, e.g. by `.manager.MAX_TIMINGS`
+BOUNDED = frozenset(['timings'])
+
+
+def open_fds():
+    """Targets of the open file descriptors by number, empty without /proc."""
+    try:
+        names = os.listdir(FD_DIR)
+    except OSError:
+        return {}
+    fds = {}
+    for name in names:
+        try:
+            fds[int(name)] = os.readlink(os.path.join(FD_DIR, name))
+        except OSError:
+            # the descriptor of the listing itself is closed by now
+            continue
+    return fds
+
+
+def fd_kind(target):
+    """Kind of a descriptor target, ``pipe`` for ``pipe:[1234]`` and the like."""
+    if ':[' in target and not target.startswith('anon_inode:'):
+        return target.split(':[', 1)[0]
+    return target
+
+
+def audit(manager):
+    """Counts of open descriptors by kind and `manager.internal_sizes()`."""
+    fds = open_fds()
+    counts = manager.internal_sizes()
+    for target in fds.values():
+        key = 'fds.%s' % fd_kind(target)
+        counts[key] = counts.get(key, 0) + 1
+    return {'counts': counts, 'fds': fds}
+
+
+def growth(before, after, tolerance=0, ignore=BOUNDED):
+    """Lines naming the counts that grew by more than `tolerance` and the new
+    descriptors of every grown kind.
+    """
+    lines = []
+    for key in sorted(after['counts']):
+        if key in ignore:
+            continue
+        old, new = before['counts'].get(key, 0), after['counts'][key]
+        if new - old <= tolerance:
+            continue
+        lines.append('%s: %d -> %d' % (key, old, new))
+        if key.startswith('fds.'):
+            for fd, target in sorted(after['fds'].items()):
+                if 'fds.%s' % fd_kind(target) == key and before['fds'].get(fd) != target:
+                    lines.append('    fd %d: %s' % (fd, target))
+    return lines
+
+
+def soak(spawner, manager, cmd, args=None, cycles=DEFAULT_CYCLES, warmup=DEFAULT_WARMUP,
+         tolerance=0, settle_timeout=DEFAULT_SETTLE_TIMEOUT, **kwargs):
+    """Run `cmd` `cycles` times with `spawner.check_output` and raise
+    `AssertionError` if descriptors, loop handles or manager maps grew.
+
+    The `warmup` cycles make lazily created handles part of the baseline.
+    Handles are closed by loop callbacks, so the final audit is repeated
+    for up to `settle_timeout` seconds. Returns the final audit.
+    """
+    for _ in range(warmup):
+        spawner.check_output(cmd, args=args, **kwargs)
+    before = audit(manager)
+
+    for _ in range(cycles):
+        spawner.check_output(cmd, args=args, **kwargs)
+
+    deadline = monotonic() + settle_timeout
+    while True:
+        after = audit(manager)
+        lines = growth(before, after, tolerance)
+        if not lines or monotonic() >= deadline:
+            break
+        time.sleep(SETTLE_INTERVAL)
+
+    if lines:
+        raise AssertionError('%d cycles of %s leaked:\n%s' % (cycles, cmd, '\n'.join(lines)))
+    return after
+
+
+def main(argv=None):
+    from .manager import Manager
+    from .plugin import SpawnerApi
+
+    parser = argparse.ArgumentParser(description='Spawn a command repeatedly and check for leaks.')
+    parser.add_argument('--cycles', type=int, default=DEFAULT_CYCLES)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--tolerance', type=int, default=0,
+                        help='allowed growth of every count (default: %(default)s)')
+    parser.add_argument('cmd')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    manager = Manager()
+    manager.start()
+    try:
+        result = soak(SpawnerApi(manager), manager, args.cmd, args=[args.cmd] + args.args,
+                      cycles=args.cycles, warmup=args.warmup, tolerance=args.tolerance)
+    except AssertionError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        manager.stop()
+
+    for key in sorted(result['counts']):
+        print('%-40s %d' % (key, result['counts'][key]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,14 +9,17 @@ import collections
 
 import pyuv
 
-from .util import nanotime
+from .util import nanotime, monotonic
+from .resources import split_placeholders
+from .activation import bind_listen_socket, close_listen_socket, DEFAULT_BACKLOG
 
 
 class ProcessTracker(object):
 
-    def __init__(self, loop):
+    def __init__(self, loop, on_kill=None):
         self._processes = []
         self._done_cb = None
+        self._on_kill = on_kill
         self._check_timer = pyuv.Timer(loop)
 
     def start(self, interval=0.1):
@@ -35,6 +38,9 @@ class ProcessTracker(object):
         if not self._check_timer.closed:
             self._check_timer.close()
 
+    def __len__(self):
+        return len(self._processes)
+
     def check(self, process, graceful_timeout=10 * 10**9):
         process.graceful_time = graceful_timeout + nanotime()
         heapq.heappush(self._processes, process)
@@ -72,29 +78,88 @@ class ProcessTracker(object):
                 break
             else:
                 # a process need to be kill. Send a SIGKILL signal
+                if self._on_kill is not None:
+                    self._on_kill(process)
                 process.kill(signal.SIGKILL)
 
                 # and close it. (maybe we should just close it)
                 process.close()
 
 
+class ProcessStatus(collections.namedtuple(
+        'ProcessStatus', 'name pid os_pid spawned_at ready paused')):
+    """Immutable view of a running process, see `ProcessState.status`."""
+
+    __slots__ = ()
+
+    @property
+    def uptime(self):
+        if self.spawned_at is None:
+            return None
+        return monotonic() - self.spawned_at
+
+
+class StateStatus(collections.namedtuple('StateStatus', 'name processes restarts paused ready')):
+    """Immutable view of a state, `processes` is a tuple of `ProcessStatus`."""
+
+    __slots__ = ()
+
+    @property
+    def os_pids(self):
+        return [process.os_pid for process in self.processes]
+
+
 class ProcessState(object):
     """Object used by the manager to maintain the process state for a config."""
 
-    def __init__(self, config):
+    def __init__(self, config, resources=None):
         self.config = config
         self.name = self.config.name
         self.stopped = False
+        self.paused = False
+        self.ready = False
+        self.restarts = 0
+        self.resources = resources
+
+        # the config doesn't change, respawns reuse what it compiles to,
+        # unless resources like template copies are leased for every process
+        _, self.per_process = split_placeholders(config.placeholders())
+        self.template = config.compile(resources)
 
         self._running = collections.deque()
 
+        # listening sockets are owned by the state, so they survive restarts
+        self.sockets = []
+        backlog = self.config.settings.get('listen_backlog', DEFAULT_BACKLOG)
+        try:
+            for address in self.config.settings.get('listen') or ():
+                self.sockets.append(bind_listen_socket(address, backlog))
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def listen_addresses(self):
+        """Addresses the listening sockets are bound to."""
+        return [sock.getsockname() for sock in self.sockets]
+
+    def close(self):
+        """Close listening sockets, running processes keep their copies."""
+        while self.sockets:
+            close_listen_socket(self.sockets.pop())
+
     @property
     def active(self):
         return len(self._running) > 0
 
-    def make_process(self, loop, emitter, pid, on_exit):
-        """Create an OS process using this template."""
-        return self.config.make_process(loop, emitter, pid, self.name, on_exit=on_exit)
+    def make_process(self, loop, emitter, pid, on_exit, forkserver=None, lease=None):
+        """Create an OS process using this template, `lease` holds resources of
+        this process only, see `.resources.ResourceAllocator.checkout`.
+        """
+        template = self.template if lease is None else self.config.compile(lease)
+        return template.make_process(
+            loop, emitter, pid, self.name, on_exit=on_exit,
+            listen_fds=[sock.fileno() for sock in self.sockets], forkserver=forkserver)
 
     def queue(self, process):
         """Put one OS process in the running queue."""
@@ -104,6 +169,22 @@ class ProcessState(object):
         """Retrieved one OS process from the queue (FIFO)."""
         return self._running.popleft()
 
+    def pause(self):
+        """Stop running processes with SIGSTOP, processes spawned later are paused too."""
+        self.paused = True
+        for process in self._running:
+            process.pause()
+
+    def resume(self):
+        self.paused = False
+        for process in self._running:
+            process.resume()
+
+    def detach(self):
+        """Forget running processes without stopping them."""
+        while self._running:
+            self._running.popleft().detach()
+
     def remove(self, process):
         """Remove an OS process from the running processes."""
         try:
@@ -111,6 +192,19 @@ class ProcessState(object):
         except ValueError:
             pass
 
+    @property
+    def processes(self):
+        return list(self._running)
+
+    def status(self):
+        """Snapshot of the state for readers in other threads."""
+        processes = tuple(
+            ProcessStatus(
+                process.name, process.pid, process.os_pid, process.timings.get('spawn'),
+                'ready' in process.timings, process.paused)
+            for process in self._running)
+        return StateStatus(self.name, processes, self.restarts, self.paused, self.ready)
+
     @property
     def os_pids(self):
         """Return pid of running processes."""
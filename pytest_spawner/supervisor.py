@@ -0,0 +1,534 @@
+# coding: utf-8
+"""Run the manager in a separate supervisor process.
+
+`RemoteManager` has the interface of `.manager.Manager` but forwards calls
+to a helper process running `main` of this module over an unix socket. Messages are pickled tuples framed like the IPC channel
+(see `.ipc`):
+
+* ``('call', request_id, method, args, kwargs, nfds)`` and
+  ``('result', request_id, ok, value)`` for manager calls,
+* ``('subscribe', evtype)`` / ``('unsubscribe', evtype)`` and
+  ``('event', evtype, event_type, event)`` for events.
+
+Process configs and event payloads have to be picklable, objects living in
+the supervisor (streams, states) are not sent. Descriptor numbers mean
+nothing in the supervisor, so the pipe ends, descriptors and files used as
+stdio targets of a loaded config are sent as the `nfds` ``SCM_RIGHTS``
+descriptors of the call (see `PassedFd`) and ``input`` has to be bytes.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import sys
+import copy
+import json
+import array
+import time
+import errno
+import shutil
+import socket
+import logging
+import tempfile
+import threading
+import itertools
+import subprocess
+import collections
+
+import six
+
+from six.moves import cPickle as pickle
+
+from .future import Future
+from .process import PipeEnd
+from .forkserver import send_fds, supported as fds_supported
+from .ipc import MessageDecoder, encode_message
+from .error import SpawnerError, TimeoutError
+from .latency import DEFAULT_STALL_THRESHOLD
+
+PICKLE_PROTOCOL = 2
+CONNECT_TIMEOUT = 10.0
+CALL_TIMEOUT = 30.0
+STOP_TIMEOUT = 30.0
+
+# imports the module instead of running it as __main__, so the unpickled
+# `PassedFd` of the client are instances of the class used by `_attach_fds`
+BOOTSTRAP = 'from pytest_spawner.supervisor import main; main()'
+
+# manager methods a client can call
+REMOTE_METHODS = frozenset([
+    'load', 'unload', 'detach', 'exists', 'commit', 'get_os_pids', 'get_resources',
+    'lock_ports', 'discard_resources',
+    'get_listen_addresses', 'send_message', 'register_template', 'pause', 'resume',
+    'is_paused', 'get_samples', 'mark_ready', 'get_timings', 'get_latency',
+    'stats', 'status', 'find_by_os_pid', 'internal_sizes'
+])
+
+# event values that only make sense inside the supervisor
+LOCAL_EVENT_KEYS = frozenset(['stream', 'state'])
+
+STDIO_LABELS = ('stdin', 'stdout', 'stderr')
+_MAX_FDS = 32
+
+# stdio target of a loaded config standing for the descriptor number `index`
+# of the call, `owned` ones are pipe ends the spawned process closes
+PassedFd = collections.namedtuple('PassedFd', 'index owned')
+
+
+def _sanitize_value(value):
+    # pyuv errors and the like might not be available on the other side
+    if isinstance(value, Exception) and not isinstance(value, SpawnerError):
+        return SpawnerError('%s: %s' % (type(value).__name__, value))
+    return value
+
+
+def _sanitize_event(event):
+    if not isinstance(event, dict):
+        return event
+    return dict(
+        (key, _sanitize_value(value)) for key, value in event.items()
+        if key not in LOCAL_EVENT_KEYS)
+
+
+def _close_all(fds):
+    for fd in fds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def _detach_fds(config):
+    """Copy of `config` with a `PassedFd` for every descriptor-like stdio
+    target and the descriptors to send, closed by the caller once sent.
+    """
+    source = config.settings.get('input')
+    if source is not None and not isinstance(source, six.binary_type):
+        raise SpawnerError('input of %s has to be bytes with the spawner supervisor' % config.name)
+
+    settings = dict(config.settings)
+    fds = []
+    try:
+        for label in STDIO_LABELS:
+            target = settings.get(label)
+            if isinstance(target, PipeEnd):
+                fds.append(target.take())
+            elif isinstance(target, six.integer_types):
+                fds.append(os.dup(target))
+            elif hasattr(target, 'fileno'):
+                fds.append(os.dup(target.fileno()))
+            else:
+                continue
+            settings[label] = PassedFd(len(fds) - 1, isinstance(target, PipeEnd))
+    except Exception:
+        _close_all(fds)
+        raise
+
+    if not fds:
+        return config, fds
+    if not fds_supported():
+        _close_all(fds)
+        raise SpawnerError(
+            'stdio descriptors of %s can\'t be sent to the spawner supervisor' % config.name)
+    config = copy.copy(config)
+    config.settings = settings
+    return config, fds
+
+
+def _attach_fds(config, fds):
+    """Put the received `fds` in place of the `PassedFd` of `config`, return
+    the new targets, pipe ends are closed by the spawned process.
+    """
+    settings = dict(config.settings)
+    targets = []
+    for label in STDIO_LABELS:
+        target = settings.get(label)
+        if isinstance(target, PassedFd):
+            fd = fds[target.index]
+            settings[label] = PipeEnd(fd) if target.owned else fd
+            targets.append(settings[label])
+    config.settings = settings
+    return targets
+
+
+def _close_targets(targets):
+    for target in targets:
+        if isinstance(target, PipeEnd):
+            target.close()
+        else:
+            _close_all([target])
+
+
+class _Connection(object):
+    """Framed pickle messages over a socket, sending is batched by a thread.
+
+    Descriptors sent along with a message are queued on receipt, the message
+    tells how many of them to `take_fds`.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._decoder = MessageDecoder()
+        self._fds = collections.deque()
+        self._pending = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._sender = threading.Thread(target=self._send_loop)
+        self._sender.daemon = True
+        self._sender.start()
+
+    def send(self, message, fds=()):
+        """Queue `message`, `fds` have to stay open until it is answered."""
+        frame = encode_message(pickle.dumps(message, PICKLE_PROTOCOL))
+        with self._condition:
+            if self._closed:
+                return
+            self._pending.append((frame, fds))
+            self._condition.notify()
+
+    def _send_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, []
+            try:
+                # everything queued in the meantime goes in one write, a
+                # frame with descriptors in one of its own
+                frames = []
+                for frame, fds in pending:
+                    if not fds:
+                        frames.append(frame)
+                        continue
+                    if frames:
+                        self._sock.sendall(b''.join(frames))
+                        frames = []
+                    send_fds(self._sock, frame, fds)
+                if frames:
+                    self._sock.sendall(b''.join(frames))
+            except (OSError, IOError, socket.error):
+                return
+
+    def _recv(self):
+        if not hasattr(self._sock, 'recvmsg'):
+            return self._sock.recv(65536)
+        fds = array.array('i')
+        data, ancdata, _, _ = self._sock.recvmsg(
+            65536, socket.CMSG_SPACE(_MAX_FDS * fds.itemsize))
+        for level, kind, cmsg_data in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                usable = len(cmsg_data) - len(cmsg_data) % fds.itemsize
+                fds.frombytes(cmsg_data[:usable])
+        self._fds.extend(fds)
+        return data
+
+    def take_fds(self, count):
+        """The next `count` received descriptors, owned by the caller."""
+        return [self._fds.popleft() for _ in range(count)]
+
+    def receive(self):
+        """Yield received messages until the connection is closed."""
+        while True:
+            try:
+                data = self._recv()
+            except (OSError, IOError, socket.error) as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                return
+            if not data:
+                return
+            self._decoder.feed(data)
+            for payload in self._decoder.messages():
+                yield pickle.loads(payload)
+
+    def close(self, flush_timeout=None):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if flush_timeout is not None and self._sender is not threading.current_thread():
+            self._sender.join(flush_timeout)
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, IOError, socket.error):
+            pass
+        self._sock.close()
+        _close_all(self._fds)
+        self._fds.clear()
+
+
+class RemoteManager(object):
+    """Client side of the supervisor, a drop-in replacement of `Manager`."""
+
+    def __init__(self, namespace=None, forkserver=None, sample_interval=None,
+                 stall_threshold=DEFAULT_STALL_THRESHOLD):
+        self.namespace = namespace
+        # passed to the manager in the supervisor
+        self.options = dict(
+            forkserver=forkserver, sample_interval=sample_interval,
+            stall_threshold=stall_threshold)
+        self._process = None
+        self._connection = None
+        self._reader = None
+        self._tmpdir = None
+        self._started = False
+
+        self._lock = threading.RLock()
+        self._listeners = {}
+        self._requests = {}
+        self._request_ids = itertools.count(1)
+
+    @property
+    def started(self):
+        return self._started
+
+    def qualify(self, name):
+        """Add the manager namespace to a process name."""
+        if self.namespace is None:
+            return name
+        return '%s@%s' % (name, self.namespace)
+
+    def start(self):
+        if self._started:
+            raise RuntimeError('Manager has been started already')
+
+        self._tmpdir = tempfile.mkdtemp(prefix='spawner-supervisor-')
+        path = os.path.join(self._tmpdir, 'supervisor.sock')
+
+        # make sure the supervisor imports this very package
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [package_root] + [item for item in [env.get('PYTHONPATH')] if item])
+        self._process = subprocess.Popen(
+            [sys.executable, '-c', BOOTSTRAP, path, json.dumps(self.options)],
+            env=env, close_fds=True)
+
+        deadline = time.time() + CONNECT_TIMEOUT
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                break
+            except (OSError, IOError, socket.error):
+                sock.close()
+                if self._process.poll() is not None or time.time() > deadline:
+                    self._cleanup()
+                    raise SpawnerError('unable to start the spawner supervisor')
+                time.sleep(0.01)
+
+        self._connection = _Connection(sock)
+        self._reader = threading.Thread(target=self._read_loop)
+        self._reader.daemon = True
+        self._reader.start()
+        self._started = True
+
+    def stop(self):
+        if not self._started:
+            return
+
+        try:
+            self._call('stop', timeout=STOP_TIMEOUT)
+        finally:
+            self._started = False
+            self._connection.close()
+            self._reader.join(STOP_TIMEOUT)
+            try:
+                self._process.wait()
+            finally:
+                self._cleanup()
+
+    def _cleanup(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def _read_loop(self):
+        for message in self._connection.receive():
+            if message[0] == 'event':
+                self._dispatch(*message[1:])
+            elif message[0] == 'result':
+                _, request_id, ok, value = message
+                with self._lock:
+                    future = self._requests.pop(request_id, None)
+                if future is None:
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+        # supervisor is gone, fail pending calls
+        with self._lock:
+            requests, self._requests = self._requests, {}
+        for future in requests.values():
+            future.set_exception(SpawnerError('spawner supervisor exited'))
+
+    def _dispatch(self, pattern, evtype, event):
+        with self._lock:
+            listeners = list(self._listeners.get(pattern, ()))
+
+        for once, listener in listeners:
+            if once:
+                with self._lock:
+                    try:
+                        self._listeners[pattern].remove((once, listener))
+                    except KeyError:
+                        # somebody else got this event
+                        continue
+            try:
+                listener(evtype, event)
+            except Exception:
+                # we ignore all exception
+                logging.error('Uncaught exception in %r', listener, exc_info=True)
+
+    def _call(self, method, *args, **kwargs):
+        timeout = kwargs.pop('timeout', CALL_TIMEOUT)
+        fds = kwargs.pop('fds', ())
+        future = Future()
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._requests[request_id] = future
+        self._connection.send(('call', request_id, method, args, kwargs, len(fds)), fds)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            with self._lock:
+                self._requests.pop(request_id, None)
+            raise
+
+    def load(self, config, start=True):
+        """Forward `Manager.load`, stdio descriptors of `config` are sent along."""
+        config, fds = _detach_fds(config)
+        try:
+            return self._call('load', config, start=start, fds=fds)
+        finally:
+            _close_all(fds)
+
+    def subscribe(self, evtype, listener, once=False):
+        """Subcribe to an event."""
+        with self._lock:
+            listeners = self._listeners.setdefault(evtype, set())
+            first = not listeners
+            listeners.add((once, listener))
+            if first:
+                self._connection.send(('subscribe', evtype))
+
+    def unsubscribe(self, evtype, listener, once=False):
+        """Unsubscribe from an event."""
+        with self._lock:
+            self._listeners[evtype].remove((once, listener))
+            if not self._listeners[evtype]:
+                self._listeners.pop(evtype)
+                self._connection.send(('unsubscribe', evtype))
+
+    def __getattr__(self, name):
+        if name not in REMOTE_METHODS:
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            return self._call(name, *args, **kwargs)
+        method.__name__ = str(name)
+        return method
+
+
+class Supervisor(object):
+    """Server side, runs a manager and serves one client."""
+
+    def __init__(self, sock, **options):
+        from .manager import Manager
+
+        self._manager = Manager(**options)
+        self._connection = _Connection(sock)
+        self._forwarders = {}
+        # stdio targets received with a config, closed once its state is gone
+        self._targets = {}
+
+    def _forwarder(self, pattern):
+        def forward(evtype, event):
+            self._connection.send(('event', pattern, evtype, _sanitize_event(event)))
+        return forward
+
+    def _handle(self, message):
+        if message[0] == 'subscribe':
+            evtype = message[1]
+            if evtype not in self._forwarders:
+                self._forwarders[evtype] = self._forwarder(evtype)
+                self._manager.subscribe(evtype, self._forwarders[evtype])
+        elif message[0] == 'unsubscribe':
+            forwarder = self._forwarders.pop(message[1], None)
+            if forwarder is not None:
+                self._manager.unsubscribe(message[1], forwarder)
+        elif message[0] == 'call':
+            _, request_id, method, args, kwargs, nfds = message
+            fds = self._connection.take_fds(nfds)
+            if method == 'stop':
+                _close_all(fds)
+                return False
+            try:
+                if method not in REMOTE_METHODS:
+                    raise AttributeError(method)
+                if method == 'load' and fds:
+                    value = self._load(fds, *args, **kwargs)
+                else:
+                    _close_all(fds)
+                    value = getattr(self._manager, method)(*args, **kwargs)
+            except Exception as exc:
+                self._connection.send(('result', request_id, False, _sanitize_value(exc)))
+            else:
+                self._connection.send(('result', request_id, True, value))
+        return True
+
+    def _load(self, fds, config, start=True):
+        self._targets[config] = _attach_fds(config, fds)
+        try:
+            return self._manager.load(config, start=start)
+        except Exception:
+            _close_targets(self._targets.pop(config))
+            raise
+
+    def _on_state_gone(self, evtype, data):
+        # processes spawned by now have their own copies
+        _close_targets(self._targets.pop(data['state'].config, ()))
+
+    def serve(self):
+        self._manager.start()
+        self._manager.subscribe(self._manager.unload_evtype, self._on_state_gone)
+        self._manager.subscribe(self._manager.detach_evtype, self._on_state_gone)
+        request_id = None
+        try:
+            for message in self._connection.receive():
+                if not self._handle(message):
+                    request_id = message[1]
+                    break
+        finally:
+            self._manager.stop()
+            for targets in self._targets.values():
+                _close_targets(targets)
+            if request_id is not None:
+                self._connection.send(('result', request_id, True, None))
+            self._connection.close(flush_timeout=STOP_TIMEOUT)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0]
+    options = json.loads(argv[1]) if len(argv) > 1 else {}
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    sock, _ = listener.accept()
+    listener.close()
+    os.unlink(path)
+
+    Supervisor(sock, **options).serve()
+
+
+if __name__ == '__main__':
+    from pytest_spawner.supervisor import main as _main
+    _main()
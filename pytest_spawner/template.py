@@ -0,0 +1,190 @@
+# coding: utf-8
+"""Template working directories for services keeping state on disk.
+
+A template is prepared once and every user gets a fresh copy of it. Files
+are cloned with reflinks where the filesystem supports them (btrfs, xfs,
+...), so a copy takes milliseconds whatever the data size, and fall back to
+plain copies. Hardlinks are available for data that is only read. Copies are
+removed by a background thread.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import errno
+import fcntl
+import shutil
+import logging
+import tempfile
+import threading
+
+import six
+from six.moves import queue
+
+# ioctl(dest_fd, FICLONE, src_fd) from linux/fs.h
+FICLONE = 0x40049409
+
+MODES = ('auto', 'reflink', 'hardlink', 'copy')
+
+logger = logging.getLogger('spawner.template')
+
+
+def reflink_file(src, dst):
+    """Clone `src` into `dst` sharing data blocks, returns False if unsupported."""
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        except (IOError, OSError) as exc:
+            if exc.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+                                 errno.ENOSYS, errno.EBADF, errno.EPERM):
+                raise
+            os.close(dst_fd)
+            os.unlink(dst)
+            return False
+        os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dst)
+    return True
+
+
+def clone_tree(src, dst, mode='auto'):
+    """Copy directory `src` to `dst` using `mode` to copy regular files."""
+    assert mode in MODES, 'unknown clone mode %r' % mode
+    state = {'reflink': mode in ('auto', 'reflink')}
+
+    def copy_file(src_path, dst_path):
+        if mode == 'hardlink':
+            os.link(src_path, dst_path)
+            return
+        if state['reflink']:
+            if reflink_file(src_path, dst_path):
+                return
+            if mode == 'reflink':
+                raise OSError(errno.EOPNOTSUPP, 'reflinks are not supported', dst_path)
+            # don't try again for every file
+            state['reflink'] = False
+        shutil.copy2(src_path, dst_path)
+
+    if six.PY2:
+        _copytree(src, dst, copy_file)
+    else:
+        shutil.copytree(src, dst, symlinks=True, copy_function=copy_file)
+
+
+def _copytree(src, dst, copy_file):
+    # copytree of python 2 has no copy_function
+    os.makedirs(dst)
+    for name in os.listdir(src):
+        src_path = os.path.join(src, name)
+        dst_path = os.path.join(dst, name)
+        if os.path.islink(src_path):
+            os.symlink(os.readlink(src_path), dst_path)
+        elif os.path.isdir(src_path):
+            _copytree(src_path, dst_path, copy_file)
+        else:
+            copy_file(src_path, dst_path)
+    shutil.copystat(src, dst)
+
+
+class _Cleaner(object):
+    """Remove directories in a background thread."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def remove(self, path):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._target)
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put(path)
+
+    def join(self):
+        self._queue.join()
+
+    def _target(self):
+        while True:
+            path = self._queue.get()
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                self._queue.task_done()
+
+
+_cleaner = _Cleaner()
+
+
+class TemplateDir(object):
+    """A directory prepared once by `setup(path)` and cloned for every user."""
+
+    def __init__(self, name, setup=None, root=None, mode='auto'):
+        assert mode in MODES, 'unknown clone mode %r' % mode
+        self.name = name
+        self.mode = mode
+        self._setup = setup
+        self._root = root
+        self._path = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # a prepared template can be used by the supervisor process
+        self.prepare()
+        return {'name': self.name, 'mode': self.mode, '_root': self._root, '_path': self._path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self.prepare()
+
+    def prepare(self):
+        """Create the template if it's not done yet, return its path."""
+        with self._lock:
+            if self._path is None:
+                if self._root is None:
+                    self._root = tempfile.mkdtemp(prefix='spawner-template-%s-' % self.name)
+                path = os.path.join(self._root, 'template')
+                os.makedirs(path)
+                try:
+                    if self._setup is not None:
+                        self._setup(path)
+                except Exception:
+                    shutil.rmtree(path, ignore_errors=True)
+                    raise
+                self._path = path
+            return self._path
+
+    def checkout(self):
+        """Return path of a fresh copy of the template."""
+        template = self.prepare()
+        path = tempfile.mkdtemp(prefix='copy-', dir=self._root)
+        os.rmdir(path)
+        clone_tree(template, path, self.mode)
+        return path
+
+    def release(self, path):
+        """Remove a copy in background."""
+        trash = path + '.trash'
+        try:
+            # the path can be reused right away
+            os.rename(path, trash)
+        except OSError:
+            trash = path
+        _cleaner.remove(trash)
+
+    def close(self):
+        """Remove the template and all its copies."""
+        with self._lock:
+            root, self._root, self._path = self._root, None, None
+        if root is not None:
+            _cleaner.remove(root)
+            _cleaner.join()
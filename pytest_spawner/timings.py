@@ -0,0 +1,61 @@
+# coding: utf-8
+"""Where the time of spawned processes goes.
+
+The manager records a `monotonic` timestamp of every phase of a process:
+
+* ``request`` -- `load` or `commit` was called, or the previous process exited
+  for a restart,
+* ``spawn`` -- the process is running,
+* ``first_output`` -- the first data was read from its stdout or stderr,
+* ``ready`` -- a health check or `ready` callback passed, see `Manager.mark_ready`,
+* ``reap`` -- SIGTERM was sent,
+* ``exit`` -- the exit was reported.
+
+`durations` turns them into the intervals shown in the terminal summary.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+PHASES = ('request', 'spawn', 'first_output', 'ready', 'reap', 'exit')
+
+# interval name, start phase and end phases, the first one recorded is used
+INTERVALS = (
+    ('startup', 'request', ('spawn', )),
+    ('first_output', 'spawn', ('first_output', )),
+    ('ready', 'spawn', ('ready', )),
+    ('run', 'spawn', ('reap', 'exit')),
+    ('shutdown', 'reap', ('exit', )),
+    ('total', 'request', ('exit', )),
+)
+
+
+def durations(phases):
+    """Length of every interval with both ends recorded."""
+    result = {}
+    for name, start, ends in INTERVALS:
+        end = next((end for end in ends if end in phases), None)
+        if start in phases and end is not None:
+            result[name] = phases[end] - phases[start]
+    return result
+
+
+def summary_lines(records, count):
+    """Lines of the terminal summary, `count` slowest processes and totals."""
+    rows = [(durations(record['phases']), record) for record in records]
+    rows = [row for row in rows if 'total' in row[0]]
+    if not rows:
+        return []
+
+    names = [name for name, _, _ in INTERVALS]
+    header = '%-30s %10s' % ('process', 'os pid') + ''.join(' %12s' % name for name in names)
+    lines = [header]
+    rows.sort(key=lambda row: row[0]['total'], reverse=True)
+    for intervals, record in rows[:count]:
+        lines.append('%-30s %10s' % (record['name'][:30], record['os_pid']) + ''.join(
+            ' %12s' % ('%.3fs' % intervals[name] if name in intervals else '-')
+            for name in names))
+
+    totals = dict((name, sum(row[0].get(name, 0.0) for row in rows)) for name in names)
+    lines.append('%-41s' % ('total of %d processes' % len(rows)) + ''.join(
+        ' %12s' % ('%.3fs' % totals[name]) for name in names))
+    return lines
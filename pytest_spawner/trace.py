@@ -0,0 +1,131 @@
+# coding: utf-8
+"""Record the spawner timeline as a Chrome trace.
+
+`TraceRecorder` subscribes to every manager event and writes a Trace Event
+JSON file, which chrome://tracing and https://ui.perfetto.dev show as one
+track per spawned process next to a track of the tests, so overlapping
+service lifetimes, idle gaps and slow teardowns stand out.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import json
+import threading
+
+from .util import monotonic
+
+# trace "processes" grouping the tracks
+SPAWNER_TRACK = 1
+PROCESS_TRACK = 2
+
+# tracks of the spawner group
+MANAGER_TID = 1
+TESTS_TID = 2
+
+# minimal time between two output counter samples of one process
+COUNTER_INTERVAL = 0.01
+
+# manager events shown as instants on the manager track
+MANAGER_EVENTS = frozenset([
+    'load', 'unload', 'detach', 'commit', 'start', 'stop', 'pause', 'resume', 'ready'])
+
+
+class TraceRecorder(object):
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._lock = threading.Lock()
+        self._events = []
+        self._running = {}
+        self._output = {}
+        self._tests = {}
+        self._start = monotonic()
+        self._metadata(SPAWNER_TRACK, None, 'process_name', 'spawner')
+        self._metadata(SPAWNER_TRACK, MANAGER_TID, 'thread_name', 'manager')
+        self._metadata(SPAWNER_TRACK, TESTS_TID, 'thread_name', 'tests')
+        self._metadata(PROCESS_TRACK, None, 'process_name', 'processes')
+
+    def start(self):
+        self._manager.subscribe((), self._on_event)
+
+    def stop(self):
+        self._manager.unsubscribe((), self._on_event)
+
+    def _now(self):
+        return int((monotonic() - self._start) * 1e6)
+
+    def _metadata(self, pid, tid, name, value):
+        event = {'ph': 'M', 'pid': pid, 'name': name, 'args': {'name': value}}
+        if tid is not None:
+            event['tid'] = tid
+        self._events.append(event)
+
+    def _instant(self, tid, name, args, pid=SPAWNER_TRACK):
+        self._events.append({
+            'ph': 'i', 's': 't', 'pid': pid, 'tid': tid, 'ts': self._now(),
+            'name': name, 'args': args})
+
+    def _on_event(self, evtype, data):
+        kind = evtype[0]
+        with self._lock:
+            if kind in MANAGER_EVENTS:
+                self._instant(MANAGER_TID, '%s %s' % (kind, data.get('name')), {})
+            elif kind == 'spawn':
+                self._metadata(
+                    PROCESS_TRACK, data['pid'], 'thread_name',
+                    '%s (%s)' % (data['name'], data['os_pid']))
+                self._running[data['pid']] = (self._now(), data['name'], data['os_pid'])
+            elif kind in ('reap', 'kill'):
+                self._instant(data['pid'], kind, {}, pid=PROCESS_TRACK)
+            elif kind == 'exit':
+                self._finish(data['pid'], {
+                    'exit_status': data.get('exit_status'),
+                    'term_signal': data.get('term_signal'),
+                    'exception': repr(data['exception']) if data.get('exception') else None})
+            elif kind == 'state' and len(evtype) > 3 and evtype[2] == 'read':
+                self._on_read(data['pid'], evtype[3], len(data['data']))
+
+    def _on_read(self, pid, label, size):
+        output = self._output.setdefault(pid, {'last': None, 'bytes': {}})
+        output['bytes'][label] = output['bytes'].get(label, 0) + size
+        now = monotonic()
+        if output['last'] is None or now - output['last'] >= COUNTER_INTERVAL:
+            output['last'] = now
+            self._events.append({
+                'ph': 'C', 'pid': PROCESS_TRACK, 'tid': pid, 'ts': self._now(),
+                'name': 'output %s' % pid, 'args': dict(output['bytes'])})
+
+    def _finish(self, pid, args):
+        if pid not in self._running:
+            return
+        start, name, os_pid = self._running.pop(pid)
+        self._output.pop(pid, None)
+        self._events.append({
+            'ph': 'X', 'pid': PROCESS_TRACK, 'tid': pid, 'ts': start,
+            'dur': self._now() - start, 'name': name, 'args': dict(args, os_pid=os_pid)})
+
+    def begin_test(self, nodeid):
+        with self._lock:
+            self._tests[nodeid] = self._now()
+
+    def end_test(self, nodeid):
+        with self._lock:
+            start = self._tests.pop(nodeid, None)
+            if start is not None:
+                self._events.append({
+                    'ph': 'X', 'pid': SPAWNER_TRACK, 'tid': TESTS_TID, 'ts': start,
+                    'dur': self._now() - start, 'name': nodeid})
+
+    def write(self, path):
+        """Write the trace, processes still running end now."""
+        with self._lock:
+            for pid in list(self._running):
+                self._finish(pid, {'running': True})
+            events = list(self._events)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f_trace:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f_trace)
@@ -5,6 +5,23 @@ from __future__ import absolute_import, unicode_literals
 import os
 import time
 import fcntl
+import resource
+import threading
+
+# names used in exit events for fields of `resource.struct_rusage`, times are
+# in seconds, max_rss in kilobytes. Exit events add ``exact``, whether the
+# usage is the one of the process alone, see `ChildrenUsage`
+RUSAGE_FIELDS = (
+    ('user_time', 'ru_utime'),
+    ('system_time', 'ru_stime'),
+    ('max_rss', 'ru_maxrss'),
+    ('minor_faults', 'ru_minflt'),
+    ('major_faults', 'ru_majflt'),
+    ('voluntary_switches', 'ru_nvcsw'),
+    ('involuntary_switches', 'ru_nivcsw'),
+    ('block_input', 'ru_inblock'),
+    ('block_output', 'ru_oublock'),
+)
 
 
 def getcwd():
@@ -21,6 +38,23 @@ def getcwd():
     return working_dir
 
 
+def which(cmd, path=None):
+    """Return full path of an executable looking it up in PATH like exec does."""
+    if os.sep in cmd:
+        return cmd if os.access(cmd, os.X_OK) else None
+    if path is None:
+        path = os.environ.get('PATH', os.defpath)
+    for directory in path.split(os.pathsep):
+        candidate = os.path.join(directory or os.curdir, cmd)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+
+# seconds from a clock that doesn't jump, time.time on Python 2
+monotonic = getattr(time, 'monotonic', time.time)
+
+
 def nanotime(s=None):
     """Convert seconds to nanoseconds. If s is None, current time is returned."""
     if s is not None:
@@ -31,3 +65,66 @@ def nanotime(s=None):
 def set_nonblocking(fd):
     flags = fcntl.fcntl(fd, fcntl.F_GETFL)
     fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def set_cloexec(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+
+class BufferPool(object):
+    """Keep a small set of reusable bytearrays to read into.
+
+    Buffers are handed out by `acquire` and must be given back with `release`
+    once the data has been copied out of them.
+    """
+
+    def __init__(self, max_buffers=4):
+        self._max_buffers = max_buffers
+        self._buffers = []
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        """Return a buffer of at least `size` bytes."""
+        with self._lock:
+            for index, buf in enumerate(self._buffers):
+                if len(buf) >= size:
+                    return self._buffers.pop(index)
+        return bytearray(size)
+
+    def release(self, buf):
+        """Give a buffer back to the pool."""
+        with self._lock:
+            if len(self._buffers) < self._max_buffers:
+                self._buffers.append(buf)
+
+
+def rusage_dict(usage):
+    """Convert `resource.struct_rusage` to a dict, see `RUSAGE_FIELDS`."""
+    return dict((name, getattr(usage, field)) for name, field in RUSAGE_FIELDS)
+
+
+class ChildrenUsage(object):
+    """Resource usage of children reaped since the previous `collect`.
+
+    libuv reaps children itself, so the usage of a single child isn't
+    available. This is the difference of `getrusage(RUSAGE_CHILDREN)`, it is
+    exact only if no other child of the interpreter was reaped in between,
+    so ``exact`` is False. The kernel only keeps the peak RSS of all children,
+    it is reported as ``children_peak_rss`` and ``max_rss`` is None.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = rusage_dict(resource.getrusage(resource.RUSAGE_CHILDREN))
+
+    def collect(self):
+        current = rusage_dict(resource.getrusage(resource.RUSAGE_CHILDREN))
+        with self._lock:
+            last, self._last = self._last, current
+
+        usage = dict((name, current[name] - last[name]) for name in current)
+        usage['max_rss'] = None
+        usage['children_peak_rss'] = current['max_rss']
+        usage['exact'] = False
+        return usage
@@ -2,6 +2,8 @@
 
 # register plugin the last to properly compute coverage
 from pytest_spawner.plugin import (
+    pytest_addoption,
     pytest_configure,
-    spawner
+    spawner,
+    spawner_services
 )
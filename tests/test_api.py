@@ -1,8 +1,18 @@
 # coding: utf-8
 
+import os
+import sys
+import time
+import signal
+import socket
+
 import pytest
 
-from pytest_spawner.error import ProcessError
+from pytest_spawner.error import ProcessError, SpawnerError
+from pytest_spawner.persistent import KeepAliveStore, process_alive
+from pytest_spawner.resources import ResourceAllocator
+from pytest_spawner.plugin import SpawnerApi, service_fixture
+from pytest_spawner.process import ProcessConfig
 
 
 def test_check_output(spawner):
@@ -17,9 +27,298 @@ def test_check_call(spawner):
         spawner.check_call('sh -c "exit 1"')
 
 
+def test_os_env(spawner):
+    env = {'SPAWNER_TEST': 'value'}
+    for _ in range(2):
+        output = spawner.check_output('sh -c "echo $SPAWNER_TEST $PATH"', env=env, os_env=True)
+        assert output.split() == [b'value', os.environ['PATH'].encode()]
+    # the config isn't modified
+    assert env == {'SPAWNER_TEST': 'value'}
+
+
+def test_rusage(spawner):
+    usage = spawner.check(sys.executable, [sys.executable, '-c', 'sum(range(10 ** 7))'])['rusage']
+    assert usage['user_time'] + usage['system_time'] > 0
+    if usage['exact']:
+        assert usage['max_rss'] > 0
+    else:
+        assert usage['max_rss'] is None
+        assert usage['children_peak_rss'] > 0
+
+
+def test_timings(spawner):
+    spawner.check_output('echo test')
+    phases = spawner._manager.get_timings()[-1]['phases']
+    assert phases['request'] <= phases['spawn'] <= phases['first_output'] <= phases['exit']
+
+
+def test_stats(spawner):
+    before = spawner._manager.stats()
+    spawner.check_output('echo test')
+    after = spawner._manager.stats()
+    assert after['spawns_total'] == before.get('spawns_total', 0) + 1
+    assert after['exits_total{status="0"}'] == before.get('exits_total{status="0"}', 0) + 1
+    assert after['read_bytes_total{stream="stdout"}'] >= 5
+
+
+def test_status(spawner):
+    manager = spawner._manager
+    with spawner.spawn('sleeper', 'sleep 10') as watcher:
+        os_pid = watcher.wait_spawn(5)
+        status = manager.status(watcher.name)
+        assert status.os_pids == [os_pid]
+        assert status.restarts == 0
+        assert status.processes[0].uptime >= 0
+        assert manager.find_by_os_pid(os_pid).name == watcher.name
+        assert watcher.name in manager.status()
+    assert not manager.exists(watcher.name)
+    assert manager.find_by_os_pid(os_pid) is None
+
+
+def test_benchmark(spawner):
+    stats = spawner.benchmark('true', warmup=1, repeats=6, concurrency=4)
+    assert stats['wall_time']['samples'] == 6
+    assert 0 < stats['wall_time']['median'] < 5
+    # the usage of concurrent runs without the fork server isn't separable
+    assert set(stats['skipped']) == {'cpu_time', 'max_rss'}
+    assert 'cpu_time' not in stats and 'max_rss' not in stats
+
+    stats = spawner.benchmark('true', warmup=0, repeats=3)
+    assert stats['cpu_time']['samples'] == 3
+    assert set(stats['skipped']) == {'max_rss'}
+
+    stats['wall_time']['median'] /= 100.0
+    stats['wall_time']['mad'] = 0.0
+    with pytest.raises(AssertionError) as excinfo:
+        spawner.benchmark('true', repeats=3, baseline={'wall_time': stats['wall_time']})
+    assert 'wall_time median' in str(excinfo.value)
+
+
+def test_soak(spawner):
+    result = spawner.soak('echo soak', cycles=50)
+    assert result['counts']['running'] == 0
+
+
 def test_spawn(spawner):
     with spawner.spawn("bash", "bash -i"):
         pass
 
     with spawner.spawn("bash", "bash -i") as watcher:
         watcher.restart()
+
+
+def test_stdio_redirect(spawner, tmpdir):
+    stdin = tmpdir.join('stdin')
+    stdin.write('test\n')
+    stdout = tmpdir.join('stdout')
+    assert spawner.check('cat', stdin=str(stdin), stdout=str(stdout))['exit_status'] == 0
+    assert stdout.read() == 'test\n'
+
+    with stdout.open('ab') as f_stream:
+        assert spawner.check('echo again', stdout=f_stream)['exit_status'] == 0
+    assert stdout.read() == 'test\nagain\n'
+
+    with pytest.raises(SpawnerError):
+        spawner.check('echo test', stdout=object(), timeout=5)
+
+
+def test_check_output_input(spawner, tmpdir):
+    assert spawner.check_output('cat', input=b'test') == b'test'
+
+    data = b'x' * (1024 * 1024)
+    assert spawner.check_output('cat', input=iter([data, data])) == data * 2
+
+    source = tmpdir.join('input')
+    source.write_binary(data)
+    with source.open('rb') as f_stream:
+        assert spawner.check_output('wc -c', input=f_stream).strip() == str(len(data)).encode()
+
+
+def test_input_ignored(spawner):
+    # the command exits without reading what it was fed
+    for size in (10, 100 * 1024):
+        result = spawner.check('sleep', args=['sleep', '0.1'], input=b'x' * size, timeout=5)
+        assert result['exit_status'] == 0
+
+
+def test_pipeline(spawner):
+    result = spawner.pipeline(['echo "b\na"', 'sort', ('head', ['head', '-n', '1'])])
+    assert result['stdout'] == b'a\n'
+    assert result['exit_statuses'] == [0, 0, 0]
+
+    assert spawner.pipeline(['cat', 'wc -c'], input=b'test')['stdout'].strip() == b'4'
+
+    with pytest.raises(ProcessError):
+        spawner.pipeline(['sh -c "exit 1"', 'cat'])
+    assert spawner.pipeline(['sh -c "exit 1"', 'cat'], pipefail=False)['exit_statuses'] == [1, 0]
+
+    with pytest.raises(ProcessError):
+        spawner.pipeline(['sh -c "kill -KILL $$"', 'cat'])
+    result = spawner.pipeline(['sh -c "kill -KILL $$"', 'cat'], pipefail=False)
+    assert result['term_signals'][0] == signal.SIGKILL
+    assert not result['term_signals'][1]
+
+
+def test_ipc(spawner):
+    script = 'from pytest_spawner.ipc import Channel; c = Channel(); c.send(c.recv() + b"!")'
+    args = [sys.executable, '-c', script]
+    with spawner.spawn('ipc', sys.executable, args=args, ipc=True, os_env=True) as watcher:
+        watcher.send(b'ping')
+        assert watcher.recv() == b'ping!'
+
+
+def test_listen(spawner):
+    script = ('import os, socket; s = socket.fromfd(3, socket.AF_INET, socket.SOCK_STREAM); '
+              'c, _ = s.accept(); '
+              'c.sendall(("%s %s" % (os.environ["LISTEN_FDS"], os.environ["LISTEN_PID"] == str(os.getpid()))).encode())')
+    args = [sys.executable, '-c', script]
+    with spawner.spawn('listen', sys.executable, args=args, listen=[('127.0.0.1', 0)], os_env=True) as watcher:
+        host, port = watcher.listen_addresses[0]
+        assert port != 0
+        client = socket.create_connection((host, port))
+        try:
+            assert client.recv(1024) == b'1 True'
+        finally:
+            client.close()
+
+
+def test_resources(spawner):
+    with spawner.create('resources', 'echo {port} {tmpdir}', capture_stdout=True) as watcher:
+        resources = watcher.resources
+        port, tmpdir = watcher.result()['stdout'].split()
+    assert int(port) == resources['port']
+    assert tmpdir.decode() == resources['tmpdir']
+
+
+def test_persistent(spawner, tmpdir):
+    api = SpawnerApi(spawner._manager, keep_alive_store=KeepAliveStore(str(tmpdir)), keep_alive=True)
+    env = {'PORT': '{port}', 'DATA': '{tmpdir}'}
+    with api.persistent('sleeper', 'sleep 30', env=env) as service:
+        assert not service.reattached
+    # the port stays locked while the service runs
+    assert ResourceAllocator()._lock_port(service.resources['port']) is None
+
+    with api.persistent('sleeper', 'sleep 30', env=env) as reattached:
+        assert reattached.reattached
+        assert reattached.os_pid == service.os_pid
+
+    # command changed, the old service is replaced
+    with api.persistent('sleeper', 'sleep 31', keep_alive=False) as replaced:
+        assert not replaced.reattached
+        assert not process_alive(service.os_pid)
+        assert not os.path.exists(service.resources['tmpdir'])
+
+
+resets = []
+service = service_fixture('service', 'sleep 60', scope='module', reset=resets.append)
+
+
+def test_service_fixture(service):
+    assert resets == []
+
+
+def test_service_fixture_reset(service):
+    assert resets == [service]
+
+
+def test_template(spawner):
+    def setup(path):
+        with open(os.path.join(path, 'data'), 'w') as f_stream:
+            f_stream.write('initial')
+
+    spawner.template('data', setup)
+    assert spawner.check_output('cat data', cwd='{template_data}') == b'initial'
+
+
+def _wait_content(path, content, timeout=5.0):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with open(path) as f_stream:
+                if f_stream.read() == content:
+                    return
+        except IOError:
+            pass
+        assert time.time() < deadline, '%s never contained %r' % (path, content)
+        time.sleep(0.01)
+
+
+def test_template_restart(spawner):
+    def setup(path):
+        with open(os.path.join(path, 'data'), 'w') as f_stream:
+            f_stream.write('initial')
+
+    spawner.template('restarted', setup)
+    # fails unless it gets a copy nobody changed
+    script = 'test "$(cat data)" = initial && printf changed > data && exec sleep 10'
+    with spawner.spawn('templated', 'sh', args=['sh', '-c', script],
+                       cwd='{template_restarted}') as watcher:
+        watcher.wait_spawn()
+        first = watcher.resources['template_restarted']
+        _wait_content(os.path.join(first, 'data'), 'changed')
+
+        watcher.restart()
+        watcher.wait_spawn()
+        second = watcher.resources['template_restarted']
+        assert second != first
+        _wait_content(os.path.join(second, 'data'), 'changed')
+
+        # the copy goes away once the old process exited
+        deadline = time.time() + 5
+        while os.path.exists(first):
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+
+def test_template_respawn(spawner):
+    def setup(path):
+        with open(os.path.join(path, 'data'), 'w') as f_stream:
+            f_stream.write('initial')
+
+    spawner.template('respawned', setup)
+    manager = spawner._manager
+    name = manager.qualify('respawned')
+    statuses = []
+
+    def on_exit(evtype, msg):
+        statuses.append(msg['exit_status'])
+
+    # exits right away and is respawned by the manager
+    script = 'test "$(cat data)" = initial && printf changed > data'
+    config = ProcessConfig(name, 'sh', args=['sh', '-c', script], cwd='{template_respawned}')
+    manager.subscribe(config.exit_evtype, on_exit)
+    manager.load(config)
+    try:
+        deadline = time.time() + 5
+        while len(statuses) < 3:
+            assert time.time() < deadline
+            time.sleep(0.01)
+    finally:
+        manager.unload(name)
+        manager.unsubscribe(config.exit_evtype, on_exit)
+    assert statuses[:3] == [0, 0, 0]
+
+
+def _process_state(os_pid):
+    with open('/proc/%d/stat' % os_pid) as f_stream:
+        return f_stream.read().rsplit(')', 1)[1].split()[0]
+
+
+def _wait_state(os_pid, states, timeout=5.0):
+    deadline = time.time() + timeout
+    while _process_state(os_pid) not in states:
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+def test_pause(spawner):
+    with spawner.spawn('paused', 'sleep 30') as watcher:
+        os_pid = watcher.wait_spawn()
+        watcher.pause()
+        assert watcher.paused
+        _wait_state(os_pid, 'T')
+        watcher.resume()
+        assert not watcher.paused
+        _wait_state(os_pid, 'SR')
+        # a paused process still stops gracefully
+        watcher.pause()
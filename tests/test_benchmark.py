@@ -0,0 +1,57 @@
+# coding: utf-8
+
+import pytest
+
+from pytest_spawner.benchmark import (
+    compare, load_results, mad, median, percentile, reject_outliers, save_results, summarize)
+
+
+def test_percentile():
+    samples = [4, 1, 3, 2]
+    assert percentile(samples, 0) == 1
+    assert percentile(samples, 100) == 4
+    assert median(samples) == 2.5
+    assert percentile([5], 90) == 5
+    with pytest.raises(ValueError):
+        percentile([], 50)
+
+
+def test_mad():
+    assert mad([1, 2, 3, 4, 100]) == 1
+    assert mad([2, 2, 2]) == 0
+
+
+def test_reject_outliers():
+    samples = [1.0, 1.1, 0.9, 1.0, 1.05, 10.0]
+    assert reject_outliers(samples) == samples[:-1]
+    assert reject_outliers([1.0, 1.0, 5.0]) == [1.0, 1.0, 5.0]
+
+
+def test_summarize():
+    summary = summarize([1.0, 1.1, 0.9, 1.0, 1.05, 10.0])
+    assert summary['samples'] == 6
+    assert summary['outliers'] == 1
+    assert summary['max'] == 1.1
+    assert summary['median'] == 1.0
+    assert summarize([1.0, 10.0, 1.0], outliers=False)['max'] == 10.0
+
+
+def test_compare(tmpdir):
+    baseline = {
+        'fast': {'median': 1.0, 'mad': 0.01},
+        'noisy': {'median': 1.0, 'mad': 0.5},
+        'removed': {'median': 1.0, 'mad': 0.0},
+    }
+    path = str(tmpdir.join('baseline.json'))
+    save_results(path, baseline)
+    assert load_results(path) == baseline
+
+    results = {
+        'fast': {'median': 1.2, 'mad': 0.01},
+        'noisy': {'median': 1.8, 'mad': 0.5},
+        'new': {'median': 5.0, 'mad': 0.0},
+    }
+    assert compare(results, baseline) == ['fast']
+    # notes without a median are ignored
+    assert compare(dict(results, skipped={}), dict(baseline, skipped={})) == ['fast']
+    assert compare(results, baseline, tolerance=0.5) == []
@@ -1,8 +1,11 @@
 # coding: utf-8
 
+import time
+
 import pyuv
 
 from pytest_spawner.events import EventEmitter
+from pytest_spawner.latency import LatencyMonitor
 
 import pytest
 
@@ -149,3 +152,43 @@ def test_unsubscribe(loop, emitter):
     loop.run()
 
     assert emitted == ["a"]
+
+
+def test_monitor(loop):
+    monitor = LatencyMonitor(threshold=0.01)
+    emitter = EventEmitter(loop, monitor=monitor)
+
+    def slow(ev):
+        time.sleep(0.02)
+
+    emitter.subscribe(("test", ), slow)
+    emitter.publish(("test", ))
+    loop.run()
+    emitter.stop()
+
+    histogram = monitor.snapshot()[__name__ + '.slow']
+    assert histogram['count'] == 1
+    assert histogram['max'] >= 0.02
+
+
+def test_monitor_names(loop):
+    monitor = LatencyMonitor(threshold=None)
+    emitter = EventEmitter(loop, monitor=monitor)
+
+    def listener(evtype):
+        # unsubscribing while dispatching still records the listener
+        emitter.unsubscribe(("test", ), listener)
+
+    emitter.subscribe(("test", ), listener)
+    emitter.subscribe(("other", ), listener)
+    emitter.subscribe(("test", ), listener)
+    assert emitter._names[listener][1] == 2
+
+    emitter.publish(("test", ))
+    loop.run()
+    assert emitter._names[listener][1] == 1
+    emitter.unsubscribe(("other", ), listener)
+    assert listener not in emitter._names
+    emitter.stop()
+
+    assert monitor.snapshot()[__name__ + '.listener']['count'] == 1
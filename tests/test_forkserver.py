@@ -0,0 +1,130 @@
+# coding: utf-8
+
+import os
+import sys
+import signal
+import socket
+import subprocess
+
+import pytest
+
+from pytest_spawner.error import SpawnerError
+from pytest_spawner.ipc import MessageDecoder
+from pytest_spawner.manager import Manager
+from pytest_spawner.plugin import SpawnerApi
+from pytest_spawner.forkserver import ForkServer, forkable, recv_message, supported
+
+pytestmark = pytest.mark.skipif(not supported(), reason='the fork server needs Python 3')
+
+
+@pytest.yield_fixture
+def forkserver():
+    server = ForkServer(['json'])
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.yield_fixture
+def manager():
+    manager = Manager(forkserver=['json'])
+    manager.start()
+    yield manager
+    manager.stop()
+
+
+def _fork(forkserver, argv, stdin=None):
+    read_fd, write_fd = os.pipe()
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    try:
+        os_pid, sock = forkserver.fork(
+            argv, dict(os.environ, GREETING='hello'), os.getcwd(),
+            [devnull if stdin is None else stdin, write_fd, 2])
+    finally:
+        os.close(write_fd)
+        os.close(devnull)
+    with os.fdopen(read_fd, 'rb') as output:
+        data = output.read()
+    message, _ = recv_message(sock, MessageDecoder())
+    sock.close()
+    return os_pid, data, message
+
+
+def test_forkable():
+    assert forkable(sys.executable, [sys.executable, '-m', 'json.tool'])
+    assert forkable(sys.executable, [sys.executable, '-c', 'pass'])
+    assert forkable(sys.executable, [sys.executable, 'script.py'])
+    assert not forkable(sys.executable, [sys.executable, '-c'])
+    assert not forkable(sys.executable, [sys.executable, '-u', 'script.py'])
+    assert not forkable('/bin/echo', ['echo', 'test'])
+
+
+def test_fork(forkserver):
+    code = 'import os, sys; print(os.environ["GREETING"], sys.argv[1:]); sys.exit(3)'
+    os_pid, data, message = _fork(forkserver, [sys.executable, '-c', code, 'arg'])
+    assert data == b"hello ['arg']\n"
+    assert message[:3] == ('exit', 3, 0)
+    assert message[3]['user_time'] >= 0 and message[3]['max_rss'] > 0
+    assert message[3]['exact']
+    assert os_pid != forkserver._process.pid
+
+
+def test_fork_module(forkserver):
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'{"a": 1}')
+    os.close(write_fd)
+    _, data, message = _fork(forkserver, [sys.executable, '-m', 'json.tool'], stdin=read_fd)
+    os.close(read_fd)
+    assert data.split() == [b'{', b'"a":', b'1', b'}']
+    assert message[:3] == ('exit', 0, 0)
+
+
+def test_fork_std_streams(forkserver):
+    # fresh std streams on the child descriptors, not the ones of the server
+    code = 'import sys; print([stream.fileno() for stream in (sys.stdin, sys.stdout, sys.stderr)])'
+    _, data, message = _fork(forkserver, [sys.executable, '-c', code])
+    assert data == b'[0, 1, 2]\n'
+    assert message[:3] == ('exit', 0, 0)
+
+
+def test_fork_signal(forkserver):
+    code = 'import os, signal; os.kill(os.getpid(), signal.SIGTERM)'
+    _, _, message = _fork(forkserver, [sys.executable, '-c', code])
+    assert message[:3] == ('exit', 0, signal.SIGTERM)
+
+
+def test_fork_timeout(tmpdir):
+    # a server that accepts connections but never answers
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(tmpdir.join('wedged.sock')))
+    listener.listen(1)
+    server = ForkServer()
+    server._path = str(tmpdir.join('wedged.sock'))
+    server._process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+    try:
+        assert server.running
+        with pytest.raises(SpawnerError):
+            server.fork([sys.executable, '-c', 'pass'], {}, os.getcwd(), [0, 1, 2], timeout=0.1)
+        assert not server.running
+    finally:
+        server.stop()
+        listener.close()
+
+
+def test_spawner(manager):
+    spawner = SpawnerApi(manager)
+    output = spawner.check_output(
+        sys.executable, [sys.executable, '-m', 'json.tool'], input=b'[1]', forkserver=True)
+    assert output.split() == [b'[', b'1', b']']
+    # not Python, spawned as usual
+    assert spawner.check_output('echo test', forkserver=True).strip() == b'test'
+
+
+def test_benchmark(manager):
+    stats = SpawnerApi(manager).benchmark(
+        sys.executable, [sys.executable, '-c', 'pass'], warmup=1, repeats=4, concurrency=2,
+        forkserver=True)
+    # forked children report their own usage
+    assert stats['skipped'] == {}
+    assert stats['cpu_time']['samples'] == 4
+    assert stats['max_rss']['min'] > 0
@@ -0,0 +1,44 @@
+# coding: utf-8
+
+import os
+import socket
+
+from pytest_spawner.ipc import Channel, MessageDecoder, encode_message
+
+
+def test_decoder():
+    decoder = MessageDecoder()
+    data = encode_message(b'hello') + encode_message(b'') + encode_message(b'world')
+    for index in range(len(data)):
+        decoder.feed(data[index:index + 1])
+    assert list(decoder.messages()) == [b'hello', b'', b'world']
+    assert list(decoder.messages()) == []
+
+
+def test_decoder_partial():
+    decoder = MessageDecoder()
+    data = encode_message(b'hello')
+    decoder.feed(data[:3])
+    assert list(decoder.messages()) == []
+    decoder.feed(data[3:])
+    assert list(decoder.messages()) == [b'hello']
+
+
+def test_channel():
+    parent, child = socket.socketpair()
+    channel = Channel(os.dup(child.fileno()))
+    child.close()
+    try:
+        parent.sendall(encode_message(b'ping') + encode_message(b'ping2'))
+        assert channel.recv() == b'ping'
+        assert channel.recv() == b'ping2'
+
+        channel.send(b'pong')
+        decoder = MessageDecoder()
+        decoder.feed(parent.recv(1024))
+        assert list(decoder.messages()) == [b'pong']
+
+        parent.close()
+        assert channel.recv() is None
+    finally:
+        channel.close()
@@ -0,0 +1,44 @@
+# coding: utf-8
+
+import logging
+
+from pytest_spawner.latency import Histogram, LatencyMonitor, listener_name
+
+
+class Listener(object):
+
+    def on_event(self, evtype):
+        pass
+
+
+def on_event(evtype):
+    pass
+
+
+def test_listener_name():
+    assert listener_name(Listener().on_event) == __name__ + '.Listener.on_event'
+    assert listener_name(on_event) == __name__ + '.on_event'
+
+
+def test_histogram():
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    for _ in range(99):
+        histogram.add(0.000010)
+    histogram.add(0.5)
+    assert histogram.count == 100
+    assert histogram.max == 0.5
+    # 10us falls in the bucket below 16us
+    assert histogram.percentile(50) == 0.000016
+    assert histogram.percentile(100) == 0.5
+    assert sum(histogram.as_dict()['buckets']) == 100
+
+
+def test_stall_warning(caplog):
+    monitor = LatencyMonitor(threshold=0.1)
+    with caplog.at_level(logging.WARNING):
+        monitor.record('fast', 0.01)
+        monitor.record('slow', 0.2)
+    assert [record.getMessage() for record in caplog.records] == [
+        'slow blocked the spawner loop for 0.200s']
+    assert sorted(monitor.snapshot()) == ['fast', 'slow']
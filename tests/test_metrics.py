@@ -0,0 +1,38 @@
+# coding: utf-8
+
+from pytest_spawner.metrics import Metrics, format_prometheus
+
+
+def test_metrics():
+    metrics = Metrics()
+    queue = [1, 2]
+    metrics.inc('spawns_total')
+    metrics.inc('spawns_total')
+    metrics.inc('read_bytes_total', 10, (('stream', 'stdout'), ))
+    metrics.collect('event_queue_depth', lambda: len(queue))
+
+    stats = metrics.snapshot()
+    assert stats == {
+        'spawns_total': 2,
+        'read_bytes_total{stream="stdout"}': 10,
+        'event_queue_depth': 2,
+    }
+    queue.append(3)
+    assert metrics.snapshot()['event_queue_depth'] == 3
+    # snapshots are copies
+    assert stats['event_queue_depth'] == 2
+
+
+def test_format_prometheus():
+    text = format_prometheus({
+        'exits_total{status="0"}': 2,
+        'exits_total{status="1"}': 1,
+        'event_queue_depth': 0,
+    })
+    assert text.splitlines() == [
+        '# TYPE spawner_event_queue_depth gauge',
+        'spawner_event_queue_depth 0',
+        '# TYPE spawner_exits_total counter',
+        'spawner_exits_total{status="0"} 2',
+        'spawner_exits_total{status="1"} 1',
+    ]
@@ -0,0 +1,37 @@
+# coding: utf-8
+
+import os
+import sys
+import subprocess
+
+from pytest_spawner.persistent import (
+    KeepAliveStore, command_fingerprint, process_alive, process_start_time, stop_process)
+
+
+def test_fingerprint():
+    fingerprint = command_fingerprint('sleep 10')
+    assert fingerprint == command_fingerprint('sleep 10')
+    assert fingerprint != command_fingerprint('sleep 20')
+    assert fingerprint != command_fingerprint('sleep 10', env={'A': '1'})
+    assert command_fingerprint('sleep', ['sleep', '10']) == command_fingerprint('sleep', 'sleep 10')
+
+
+def test_store(tmpdir):
+    store = KeepAliveStore(str(tmpdir.join('spawner')))
+    assert store.get('db') is None
+    store.put('db', {'os_pid': 1})
+    assert store.get('db') == {'os_pid': 1}
+    store.remove('db')
+    assert store.get('db') is None
+
+
+def test_process_alive():
+    process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+    start_time = process_start_time(process.pid)
+    assert process_alive(process.pid, start_time)
+    assert not process_alive(process.pid, start_time + 1)
+
+    stop_process(process.pid, start_time)
+    assert not process_alive(process.pid, start_time)
+    process.wait()
+    assert process_alive(os.getpid())
@@ -0,0 +1,54 @@
+# coding: utf-8
+
+import os
+import fcntl
+
+import pyuv
+import pytest
+
+from pytest_spawner.events import EventEmitter
+from pytest_spawner.process import ProcessConfig, Stream
+
+# not exposed by the fcntl module of python 2
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+
+
+class FakeProcess(object):
+    name = 'test'
+    pid = 1
+    metrics = None
+
+    def __init__(self):
+        self.config = ProcessConfig('test', 'true')
+        self.timings = {}
+
+
+@pytest.mark.skipif(not hasattr(os, 'uname') or os.uname()[0] != 'Linux',
+                    reason='needs F_SETPIPE_SZ')
+def test_speculative_read():
+    loop = pyuv.Loop()
+    emitter = EventEmitter(loop)
+    process = FakeProcess()
+    stream = Stream(loop, emitter, process, 'stdout')
+
+    received = []
+    emitter.subscribe(stream.read_evtype, lambda evtype, msg: received.append(msg['data']))
+
+    # data left in the pipe by an exited process, larger than a single read
+    data = os.urandom(200 * 1024)
+    read_fd, write_fd = os.pipe()
+    fcntl.fcntl(write_fd, F_SETPIPE_SZ, 256 * 1024)
+    assert os.write(write_fd, data) == len(data)
+    os.close(write_fd)
+    stream._channel.open(read_fd)
+    stream.start()
+
+    stream.speculative_read()
+    loop.run()
+    stream.stop()
+    emitter.stop()
+    loop.run()
+
+    assert len(received) == 1
+    assert received[0] == data
+    assert 'first_output' in process.timings
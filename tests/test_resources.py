@@ -0,0 +1,102 @@
+# coding: utf-8
+
+import os
+
+from pytest_spawner.resources import ResourceAllocator, find_placeholders, kept_resources
+from pytest_spawner.template import TemplateDir
+
+
+def test_find_placeholders():
+    names = find_placeholders('server --port {port}', ['--admin', '{port_admin}'], {'DATA': '{tmpdir}'}, None)
+    assert names == set(['port', 'port_admin', 'tmpdir'])
+    assert find_placeholders("awk '{print $1}'") == set()
+
+
+def test_lease(tmpdir):
+    allocator = ResourceAllocator(lock_dir=str(tmpdir))
+    lease = allocator.lease('server', ['port', 'port_admin', 'tmpdir', 'socket'])
+    assert lease.values['port'] != lease.values['port_admin']
+    assert os.path.isdir(lease.values['tmpdir'])
+    assert lease.substitute('--port={port} {unknown}') == '--port=%d {unknown}' % lease.values['port']
+    assert lease.substitute({'SOCK': '{socket}'}) == {'SOCK': lease.values['socket']}
+    # only strings are substituted
+    assert lease.substitute([b'--port', '{port}']) == [b'--port', str(lease.values['port'])]
+    assert lease.substitute({'SOCK': '{socket}', 'LEVEL': 1}) == {'SOCK': lease.values['socket'], 'LEVEL': 1}
+    assert lease.substitute(None) is None
+    assert allocator.get('server') == lease.values
+
+    # ports locked by other allocators are skipped
+    other = ResourceAllocator(lock_dir=str(tmpdir)).lease('other', ['port'])
+    assert other.values['port'] not in (lease.values['port'], lease.values['port_admin'])
+
+    path = lease.values['tmpdir']
+    allocator.release('server')
+    assert not os.path.exists(path)
+    assert allocator.get('server') == {}
+    other.release()
+
+
+def test_lease_template(tmpdir):
+    template = TemplateDir('data', root=str(tmpdir.join('templates')))
+    allocator = ResourceAllocator(lock_dir=str(tmpdir))
+    allocator.register_template(template)
+    lease = allocator.lease('server', ['template_data'])
+    path = lease.values['template_data']
+    assert os.path.isdir(path)
+    assert path != template.path
+    allocator.release_all()
+    assert not os.path.exists(path)
+
+
+def test_lease_held(tmpdir):
+    template = TemplateDir('data', root=str(tmpdir.join('templates')))
+    allocator = ResourceAllocator(lock_dir=str(tmpdir))
+    allocator.register_template(template)
+    lease = allocator.lease('server', ['tmpdir'])
+    first = allocator.checkout('server', ['template_data'], lease)
+    second = allocator.checkout('server', ['template_data'], lease)
+    assert first.values['tmpdir'] == lease.values['tmpdir']
+    assert first.values['template_data'] != second.values['template_data']
+
+    # a process still holds the lease, e.g. while a restarted config is loaded
+    lease.hold()
+    path = lease.values['tmpdir']
+    allocator.lease('server', ['tmpdir'])
+    allocator.release('server', lease)
+    assert os.path.isdir(path)
+    lease.drop()
+    assert not os.path.exists(path)
+
+    copy = first.values['template_data']
+    first.hold()
+    first.release()
+    assert os.path.isdir(copy)
+    first.drop()
+    assert not os.path.exists(copy)
+    allocator.release_all()
+
+
+def test_detach(tmpdir):
+    allocator = ResourceAllocator(lock_dir=str(tmpdir))
+    other = ResourceAllocator(lock_dir=str(tmpdir))
+    lease = allocator.lease('server', ['port', 'socket'])
+    lease.hold()
+    ports, paths = kept_resources(lease.values)
+    assert ports == [lease.values['port']]
+    assert paths == [os.path.dirname(lease.values['socket'])]
+
+    # the detached process keeps its port and directories
+    allocator.detach('server', lease)
+    assert allocator.get('server') == {}
+    assert other._lock_port(ports[0]) is None
+    allocator.release_all()
+    assert os.path.isdir(paths[0])
+
+    # the next session reattaches to the process and locks the port again
+    other.lock_ports('server', ports)
+    assert allocator._lock_port(ports[0]) is None
+    other.discard('server', paths)
+    assert not os.path.exists(paths[0])
+    fd = allocator._lock_port(ports[0])
+    assert fd is not None
+    os.close(fd)
@@ -0,0 +1,93 @@
+# coding: utf-8
+
+import os
+import sys
+import time
+import threading
+
+import pyuv
+import pytest
+
+from pytest_spawner.manager import Manager
+from pytest_spawner.plugin import SpawnerApi
+from pytest_spawner.sampler import Sampler, Series, read_sample, supported
+
+pytestmark = pytest.mark.skipif(not supported(), reason='needs /proc')
+
+
+def test_read_sample():
+    sample = read_sample(os.getpid())
+    assert sample[0] <= time.time()
+    assert sample[1] > 0
+    assert sample[2] > 0
+
+
+def test_series():
+    series = Series('test', 1, os.getpid())
+    assert series.max('rss') is None
+    series.append((1.0, 1.0, 100, 0, 0))
+    series.append((3.0, 2.0, 300, 10, 0))
+    series.append((5.0, 3.0, 200, 20, 0))
+    assert len(series) == 3
+    assert series.max('rss') == 300
+    assert series.last('read_bytes') == 20
+    assert series.cpu_percent() == 50.0
+    copy = series.copy()
+    series.append((7.0, 4.0, 400, 20, 0))
+    assert len(copy) == 3
+
+
+@pytest.yield_fixture
+def manager():
+    manager = Manager(sample_interval=0.05)
+    manager.start()
+    yield manager
+    manager.stop()
+
+
+def test_sampler(manager):
+    code = 'import time; data = b"x" * (32 * 1024 * 1024); time.sleep(5)'
+    spawner = SpawnerApi(manager)
+    with spawner.create('sampled', sys.executable, [sys.executable, '-c', code]) as watcher:
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            samples = watcher.samples
+            if samples and list(samples.values())[0].max('rss') > 32 * 1024 * 1024:
+                break
+            time.sleep(0.05)
+        watcher.assert_max('rss', 1024 * 1024 * 1024)
+        with pytest.raises(AssertionError):
+            watcher.assert_max('rss', 1024 * 1024)
+
+
+class FakeProcess(object):
+
+    def __init__(self, name, pid, os_pid):
+        self.name = name
+        self.pid = pid
+        self.os_pid = os_pid
+
+
+def test_sample_without_lock(monkeypatch):
+    lock = threading.RLock()
+    processes = {1: FakeProcess('test', 1, os.getpid())}
+    sampler = Sampler(pyuv.Loop(), 1.0, processes, lock)
+
+    def try_lock():
+        if lock.acquire(False):
+            acquired.append(True)
+            lock.release()
+
+    def read_unlocked(os_pid):
+        # the lock is free for other threads while /proc is read
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return read_sample(os_pid)
+
+    acquired = []
+    monkeypatch.setattr('pytest_spawner.sampler.read_sample', read_unlocked)
+    sampler._on_sample(None)
+    assert acquired == [True]
+    assert len(sampler.get('test')[1]) == 1
+    sampler.stop()
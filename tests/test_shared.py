@@ -0,0 +1,58 @@
+# coding: utf-8
+
+import threading
+
+import pytest
+
+from pytest_spawner.error import TimeoutError
+from pytest_spawner.shared import SharedRegistry
+
+
+def test_acquire_release(tmpdir):
+    gw0 = SharedRegistry(str(tmpdir), 'gw0')
+    gw1 = SharedRegistry(str(tmpdir), 'gw1')
+    started = []
+    stopped = []
+
+    def start():
+        started.append(True)
+        return {'port': 1234}
+
+    assert gw0.acquire('db', start) == ({'port': 1234}, True)
+    assert gw1.acquire('db', start) == ({'port': 1234}, False)
+    assert started == [True]
+
+    # the owner keeps the service running for the other worker
+    gw0.release('db', True, lambda: stopped.append(True))
+    assert not stopped
+    assert gw1.acquire('db', start) == ({'port': 1234}, False)
+
+    thread = threading.Thread(target=gw0.finish)
+    thread.start()
+    thread.join(0.3)
+    # the owner waits for the other worker
+    assert thread.is_alive()
+    assert not stopped
+
+    gw1.release('db', False)
+    thread.join(5)
+    assert stopped == [True]
+
+    # the next user starts the service again
+    assert gw1.acquire('db', start) == ({'port': 1234}, True)
+    assert started == [True, True]
+    gw1.release('db', True)
+    gw1.finish()
+
+
+def test_finish_timeout(tmpdir):
+    gw0 = SharedRegistry(str(tmpdir), 'gw0')
+    gw1 = SharedRegistry(str(tmpdir), 'gw1')
+    stopped = []
+    gw0.acquire('db', dict)
+    gw1.acquire('db', dict)
+    gw0.release('db', True, lambda: stopped.append(True), timeout=0.2)
+    with pytest.raises(TimeoutError):
+        gw0.finish()
+    # stopped anyway
+    assert stopped == [True]
@@ -0,0 +1,48 @@
+# coding: utf-8
+
+import os
+
+import pytest
+
+from pytest_spawner.soak import audit, fd_kind, growth, open_fds
+
+
+class FakeManager(object):
+
+    def __init__(self):
+        self.sizes = {'running': 0, 'timings': 0}
+
+    def internal_sizes(self):
+        return dict(self.sizes)
+
+
+def test_fd_kind():
+    assert fd_kind('pipe:[1234]') == 'pipe'
+    assert fd_kind('socket:[1234]') == 'socket'
+    assert fd_kind('anon_inode:[eventfd]') == 'anon_inode:[eventfd]'
+    assert fd_kind('/dev/null') == '/dev/null'
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc')
+def test_growth():
+    manager = FakeManager()
+    before = audit(manager)
+    assert growth(before, audit(manager)) == []
+
+    reader, writer = os.pipe()
+    try:
+        assert reader in open_fds()
+        manager.sizes['running'] = 1
+        manager.sizes['timings'] = 10
+        lines = growth(before, audit(manager))
+    finally:
+        os.close(reader)
+        os.close(writer)
+
+    assert 'fds.pipe: %d -> %d' % (
+        before['counts'].get('fds.pipe', 0), before['counts'].get('fds.pipe', 0) + 2) in lines
+    assert any(line.startswith('    fd %d: pipe:[' % reader) for line in lines)
+    assert 'running: 0 -> 1' in lines
+    # bounded by the manager
+    assert not any(line.startswith('timings') for line in lines)
+    assert growth(before, audit(manager), tolerance=2) == []
@@ -0,0 +1,53 @@
+# coding: utf-8
+
+import pytest
+
+from pytest_spawner.error import ProcessError, SpawnerError, StateNotFound
+from pytest_spawner.plugin import SpawnerApi
+from pytest_spawner.supervisor import RemoteManager
+
+
+@pytest.yield_fixture
+def manager():
+    manager = RemoteManager()
+    manager.start()
+    yield manager
+    manager.stop()
+
+
+def test_check_output(manager):
+    spawner = SpawnerApi(manager)
+    assert spawner.check_output('echo test').strip() == b'test'
+    with pytest.raises(ProcessError):
+        spawner.check_output('sh -c "exit 1"')
+
+
+def test_errors(manager):
+    assert not manager.exists('unknown')
+    with pytest.raises(StateNotFound):
+        manager.unload('unknown')
+
+
+def test_pipeline(manager):
+    spawner = SpawnerApi(manager)
+    result = spawner.pipeline(['echo "b\na"', 'sort', ('head', ['head', '-n', '1'])])
+    assert result['stdout'] == b'a\n'
+    assert result['exit_statuses'] == [0, 0, 0]
+
+    assert spawner.pipeline(['cat', 'wc -c'], input=b'test')['stdout'].strip() == b'4'
+
+
+def test_stdio_redirect(manager, tmpdir):
+    spawner = SpawnerApi(manager)
+    stdout = tmpdir.join('stdout')
+    with stdout.open('wb') as f_stream:
+        assert spawner.check('echo test', stdout=f_stream)['exit_status'] == 0
+        assert spawner.check('echo again', stdout=f_stream.fileno())['exit_status'] == 0
+    assert stdout.read() == 'test\nagain\n'
+
+
+def test_input(manager):
+    spawner = SpawnerApi(manager)
+    assert spawner.check_output('cat', input=b'test') == b'test'
+    with pytest.raises(SpawnerError):
+        spawner.check_output('cat', input=iter([b'test']))
@@ -0,0 +1,52 @@
+# coding: utf-8
+
+import os
+import pickle
+
+import pytest
+
+from pytest_spawner.template import TemplateDir, clone_tree
+
+
+def setup_data(path):
+    os.mkdir(os.path.join(path, 'db'))
+    with open(os.path.join(path, 'db', 'data'), 'w') as f_stream:
+        f_stream.write('initial')
+    os.symlink('db/data', os.path.join(path, 'link'))
+
+
+@pytest.mark.parametrize('mode', ['auto', 'hardlink', 'copy'])
+def test_clone_tree(tmpdir, mode):
+    src = tmpdir.join('src')
+    src.mkdir()
+    setup_data(str(src))
+    clone_tree(str(src), str(tmpdir.join('dst')), mode)
+    assert tmpdir.join('dst', 'db', 'data').read() == 'initial'
+    assert os.readlink(str(tmpdir.join('dst', 'link'))) == 'db/data'
+
+
+def test_template(tmpdir):
+    calls = []
+
+    def setup(path):
+        calls.append(path)
+        setup_data(path)
+
+    template = TemplateDir('db', setup, root=str(tmpdir.join('root')))
+    first = template.checkout()
+    second = template.checkout()
+    assert len(calls) == 1
+    assert first != second
+
+    with open(os.path.join(first, 'db', 'data'), 'w') as f_stream:
+        f_stream.write('changed')
+    assert open(os.path.join(second, 'db', 'data')).read() == 'initial'
+
+    template.release(first)
+    assert not os.path.exists(first)
+
+    copy = pickle.loads(pickle.dumps(template))
+    assert copy.path == template.path
+
+    template.close()
+    assert not tmpdir.join('root').exists()
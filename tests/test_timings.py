@@ -0,0 +1,26 @@
+# coding: utf-8
+
+from pytest_spawner.timings import durations, summary_lines
+
+
+def test_durations():
+    phases = {'request': 1.0, 'spawn': 1.5, 'first_output': 2.0, 'reap': 4.0, 'exit': 4.5}
+    assert durations(phases) == {
+        'startup': 0.5, 'first_output': 0.5, 'run': 2.5, 'shutdown': 0.5, 'total': 3.5}
+    assert durations({'request': 1.0}) == {}
+    # exited on its own
+    assert durations({'spawn': 1.0, 'exit': 3.0}) == {'run': 2.0}
+
+
+def test_summary_lines():
+    records = [
+        {'name': 'fast', 'os_pid': 1, 'phases': {'request': 0.0, 'spawn': 0.1, 'exit': 0.2}},
+        {'name': 'slow', 'os_pid': 2, 'phases': {'request': 0.0, 'spawn': 0.1, 'exit': 2.0}},
+        {'name': 'running', 'os_pid': 3, 'phases': {'request': 0.0, 'spawn': 0.1}},
+    ]
+    lines = summary_lines(records, 1)
+    assert len(lines) == 3
+    assert lines[1].startswith('slow')
+    assert lines[1].split()[-3:] == ['1.900s', '-', '2.000s']
+    assert lines[2].startswith('total of 2 processes')
+    assert summary_lines(records[2:], 1) == []
@@ -0,0 +1,51 @@
+# coding: utf-8
+
+import json
+
+from pytest_spawner.trace import TraceRecorder, PROCESS_TRACK
+
+
+class FakeManager(object):
+
+    def __init__(self):
+        self.listeners = []
+
+    def subscribe(self, evtype, listener, once=False):
+        self.listeners.append((evtype, listener))
+
+    def publish(self, evtype, **event):
+        for _, listener in self.listeners:
+            listener(evtype, dict(event, event=evtype))
+
+
+def test_trace(tmpdir):
+    manager = FakeManager()
+    recorder = TraceRecorder(manager)
+    recorder.start()
+    assert manager.listeners[0][0] == ()
+
+    recorder.begin_test('test_a')
+    manager.publish(('load', ), name='web')
+    manager.publish(('spawn', ), name='web', pid=1, os_pid=100)
+    manager.publish(('spawn', ), name='db', pid=2, os_pid=101)
+    manager.publish(('state', 'web', 'read', 'stdout'), name='web', pid=1, data=b'hello')
+    manager.publish(('reap', ), name='web', pid=1, os_pid=100)
+    manager.publish(('kill', ), name='web', pid=1, os_pid=100)
+    manager.publish(('exit', ), name='web', pid=1, exit_status=0, term_signal=9, exception=None)
+    recorder.end_test('test_a')
+
+    path = tmpdir.join('trace', 'spawner.json')
+    recorder.write(str(path))
+    events = json.loads(path.read())['traceEvents']
+
+    slices = dict((event['name'], event) for event in events if event['ph'] == 'X')
+    assert set(slices) == set(['web', 'db', 'test_a'])
+    assert slices['web']['pid'] == PROCESS_TRACK
+    assert slices['web']['args']['term_signal'] == 9
+    # still running at the end of the session
+    assert slices['db']['args']['running']
+
+    counters = [event for event in events if event['ph'] == 'C']
+    assert counters[0]['args'] == {'stdout': 5}
+    instants = [event['name'] for event in events if event['ph'] == 'i']
+    assert instants == ['load web', 'reap', 'kill']
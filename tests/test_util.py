@@ -0,0 +1,21 @@
+# coding: utf-8
+
+import sys
+import subprocess
+
+from pytest_spawner.util import ChildrenUsage
+
+
+def test_children_usage():
+    usage = ChildrenUsage()
+    subprocess.check_call([sys.executable, '-c', 'data = b"x" * (64 * 1024 * 1024)'])
+    first = usage.collect()
+    assert first['children_peak_rss'] > 64 * 1024
+    assert first['user_time'] + first['system_time'] > 0
+
+    # a second, smaller child only has the peak of all children
+    subprocess.check_call(['true'])
+    second = usage.collect()
+    assert not second['exact']
+    assert second['max_rss'] is None
+    assert second['children_peak_rss'] >= first['children_peak_rss']